@@ -1 +1,14 @@
 APP_NAME = "Automated - Linux"
+
+# Everything the build leaves behind on the controller side lives next to
+# the disk images, under the (gitignored) build-images/ directory.
+BUILD_IMAGES_DIR = "build-images"
+TIMELINE_DIR = f"{BUILD_IMAGES_DIR}/timeline"
+EVENTS_DIR = f"{BUILD_IMAGES_DIR}/events"
+METRICS_FILE = f"{BUILD_IMAGES_DIR}/metrics/automated-linux.prom"
+LOGS_DIR = f"{BUILD_IMAGES_DIR}/logs"
+CHECKPOINTS_FILE = f"{BUILD_IMAGES_DIR}/checkpoints/stages.json"
+SNAPSHOTS_DIR = f"{BUILD_IMAGES_DIR}/snapshots"
+
+PLAYBOOKS_DIR = "playbooks"
+VARS_FILE = "vars/automated-linux.yaml"
@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# Copy-on-write copies of the disk images, shared by `run.py
+# --restore-snapshot` and playbooks/tasks/stage-snapshot.yaml, which runs
+# this file as a script on the host:
+#
+#     python3 app/clone.py take [--full-copies] <build-images> <stage> "<later stages>" <image>...
+#
+# Standard library only, so that works without the app package's
+# dependencies (and without importing the package at all).
+
+
+def clone_file(source, target, copy=True):
+    """
+    Copies a file as a copy-on-write clone where the filesystem supports it
+    (clonefile(2) on macOS, a reflink on Linux), as a plain copy otherwise.
+
+    Args:
+        copy (bool): Whether to fall back to a plain copy at all.
+
+    Returns:
+        str | None: "clone" or "copy", None if the file could not be
+            cloned and copy is false.
+    """
+    for command in (["cp", "-c"], ["cp", "--reflink=always"]):
+        if subprocess.run(command + [source, target], stderr=subprocess.DEVNULL).returncode == 0:
+            return "clone"
+    if not copy:
+        return None
+    subprocess.run(["cp", source, target], check=True)
+    return "copy"
+
+
+def take_snapshot(build_images, stage, images, later=(), full_copies=False):
+    """
+    Clones images from build_images into build_images/snapshots/<stage>,
+    next to a snapshot.json record, and drops the snapshots of the later
+    stages: they were taken on top of what this stage just rebuilt.
+
+    Where the filesystem cannot clone, a snapshot would be a full copy of
+    every image (tens of GB, minutes of I/O) instead of a free one, so it
+    is skipped unless full_copies is set.
+
+    Args:
+        build_images (str): The build-images directory.
+        stage (str): The stage the snapshot is taken after.
+        images (list): Basenames of the image files to clone.
+        later (list): The stages after this one.
+        full_copies (bool): Take the snapshot as plain copies if need be.
+
+    Returns:
+        dict: The snapshot's record, with a "skipped" reason instead of
+            images if it was skipped.
+    """
+    started = time.monotonic()
+    snapshots = os.path.join(build_images, "snapshots")
+    staging = os.path.join(snapshots, f".{stage}")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    methods = {}
+    for image in images:
+        methods[image] = clone_file(os.path.join(build_images, image), os.path.join(staging, image),
+                                    copy=full_copies)
+        if methods[image] is None:
+            break
+    # Whatever happens to this one, the older snapshots of this stage and
+    # the ones after it no longer match the images.
+    for name in [stage] + list(later):
+        shutil.rmtree(os.path.join(snapshots, name), ignore_errors=True)
+    if None in methods.values():
+        shutil.rmtree(staging)
+        return dict(stage=stage, skipped=f"{build_images} cannot clone files (no clonefile(2) or reflink "
+                                         "support), and stage_snapshots.full_copies is off")
+    record = dict(
+        stage=stage,
+        taken=datetime.now().isoformat(timespec="seconds"),
+        images=methods,
+        bytes=sum(os.path.getsize(os.path.join(staging, image)) for image in images),
+        seconds=round(time.monotonic() - started, 1),
+    )
+    with open(os.path.join(staging, "snapshot.json"), "w", encoding="utf-8") as outfile:
+        json.dump(record, outfile, indent=2)
+    os.rename(staging, os.path.join(snapshots, stage))
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Takes a stage snapshot of the disk images.")
+    parser.add_argument("command", choices=["take"])
+    parser.add_argument("--full-copies", action="store_true",
+                        help="copy the images where they cannot be cloned, instead of skipping the snapshot")
+    parser.add_argument("build_images")
+    parser.add_argument("stage")
+    parser.add_argument("later", help="the stages after STAGE, space-separated")
+    parser.add_argument("images", nargs="+", metavar="image")
+    args = parser.parse_args()
+    record = take_snapshot(args.build_images, args.stage, args.images, args.later.split(),
+                           full_copies=args.full_copies)
+    if "skipped" in record:
+        sys.stderr.write(f"snapshot of the {args.stage} stage skipped: {record['skipped']}\n")
+    print(json.dumps(record))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import queue
+import sys
+import threading
+
+# res fields that carry raw command output — megabytes for a `make -j` of
+# gcc, glibc or the kernel. Nothing downstream needs them to keep the
+# timeline and progress metrics correct, so they are what gets shed first
+# when the consumer falls behind.
+BULKY_RES_FIELDS = ("stdout", "stderr", "stdout_lines", "stderr_lines")
+
+# Events the sinks cannot do without: task starts and ends (the console
+# status line, the timeline, the stage checkpoints), per-item failures and
+# the final stats. On a full queue these wait for room instead of being
+# dropped; only everything else (verbose and debug output, per-item
+# results, play/include notices, ...) is shed.
+ESSENTIAL_EVENTS = {"playbook_on_task_start", "runner_on_ok", "runner_on_failed", "runner_on_skipped",
+                    "runner_on_unreachable", "runner_item_on_failed", "playbook_on_stats"}
+
+_STOP = object()
+
+
+class Sink:
+    """
+    Base class for everything the EventPipeline fans events out to.
+
+    Methods
+    -------
+    handle(event):
+        Processes a single event. Must be implemented by subclasses.
+    handle_batch(events):
+        Processes a batch of events; defaults to calling handle() on each.
+    close():
+        Flushes and releases whatever the sink holds open.
+    """
+
+    def handle(self, event):
+        raise NotImplementedError
+
+    def handle_batch(self, events):
+        for event in events:
+            self.handle(event)
+
+    def close(self):
+        pass
+
+
+def shed_event(event):
+    """
+    Returns a copy of the event without the bulky command output in its res.
+
+    Args:
+        event (dict): An ansible_runner event.
+
+    Returns:
+        dict: The slimmed-down event (the original is left untouched).
+    """
+    data = event.get("event_data") or {}
+    res = data.get("res")
+    if not isinstance(res, dict):
+        return event
+    # package_recipe results carry the output of each phase separately.
+    phases = res.get("phases") if isinstance(res.get("phases"), list) else []
+    if not any(f in res for f in BULKY_RES_FIELDS) and \
+            not any(f in phase for phase in phases for f in BULKY_RES_FIELDS):
+        return event
+    res = {k: v for k, v in res.items() if k not in BULKY_RES_FIELDS}
+    if phases:
+        res["phases"] = [{k: v for k, v in phase.items() if k not in BULKY_RES_FIELDS}
+                         for phase in phases]
+    res["output_shed"] = True
+    return dict(event, event_data=dict(data, res=res))
+
+
+class EventPipeline:
+    """
+    Decouples ansible_runner's event callback from everything that consumes
+    events. submit() only ever enqueues; a background thread drains the
+    bounded queue in batches and hands each batch to every sink.
+
+    Backpressure barely reaches the producer: above the high-water mark
+    events are shed of their bulky output before being queued, and once the
+    queue is completely full new events are dropped and counted instead of
+    blocking the build. Only ESSENTIAL_EVENTS wait (up to block_timeout)
+    for room instead; one dropped even then is counted in lost, which the
+    sinks that depend on every task end (stage checkpoints) check.
+
+    Methods
+    -------
+    start():
+        Starts the consumer thread.
+    submit(event):
+        Queues an event, only ever blocking for an essential one.
+    close(timeout):
+        Drains the queue, stops the consumer and closes every sink.
+    """
+
+    def __init__(self, sinks, maxsize: int = 10000, batch_size: int = 256,
+                 flush_interval: float = 0.5, high_water: float = 0.8, block_timeout: float = 5.0):
+        """
+        Initializes the pipeline.
+
+        Args:
+            sinks (list[Sink]): Where events are delivered, in order.
+            maxsize (int): Capacity of the event queue.
+            batch_size (int): Maximum number of events per delivered batch.
+            flush_interval (float): Seconds the consumer waits for more
+                events before delivering a partial batch.
+            high_water (float): Fraction of maxsize above which events are
+                shed of their command output.
+            block_timeout (float): Seconds an essential event waits for
+                room in a full queue before it is dropped too.
+        """
+        self.sinks = sinks
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.high_water = int(maxsize * high_water)
+        self.block_timeout = block_timeout
+        self.submitted = 0
+        self.shed = 0
+        self.dropped = 0
+        self.lost = 0
+        self.sink_errors = 0
+        self.thread = threading.Thread(
+            target=self.consume, name="event-pipeline", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def submit(self, event):
+        """
+        Queues an event for the consumer thread. On a full queue an
+        essential event waits up to block_timeout, any other one is dropped.
+
+        Args:
+            event (dict): An ansible_runner event.
+
+        Returns:
+            bool: False if the queue was full and the event was dropped.
+        """
+        self.submitted += 1
+        if self.queue.qsize() >= self.high_water:
+            shed = shed_event(event)
+            if shed is not event:
+                self.shed += 1
+                event = shed
+        essential = event.get("event") in ESSENTIAL_EVENTS
+        try:
+            if essential:
+                self.queue.put(event, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            if essential:
+                self.lost += 1
+            return False
+        return True
+
+    def next_batch(self):
+        """
+        Blocks up to flush_interval for the first event, then drains
+        whatever else is already queued, up to batch_size.
+
+        Returns:
+            tuple[list, bool]: The batch and whether the stop marker was seen.
+        """
+        batch = []
+        try:
+            first = self.queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return batch, False
+        if first is _STOP:
+            return batch, True
+        batch.append(first)
+        while len(batch) < self.batch_size:
+            try:
+                event = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is _STOP:
+                return batch, True
+            batch.append(event)
+        return batch, False
+
+    def consume(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self.next_batch()
+            if batch:
+                self.deliver(batch)
+
+    def deliver(self, batch):
+        # One misbehaving sink (a full disk under the JSONL file, a closed
+        # terminal) must not starve the others.
+        for sink in self.sinks:
+            try:
+                sink.handle_batch(batch)
+            except Exception as error:
+                self.sink_errors += 1
+                sys.stderr.write(f"event sink {type(sink).__name__} failed: {error}\n")
+
+    def close(self, timeout: float = 30.0):
+        """
+        Delivers everything still queued, then closes the sinks. A consumer
+        still running after `timeout` may be in the middle of writing to
+        them, so the sinks are left open then.
+
+        Args:
+            timeout (float): Seconds to wait for the consumer to drain.
+
+        Returns:
+            bool: Whether every queued event was delivered and the sinks
+                closed.
+        """
+        if self.thread.is_alive():
+            # The stop marker must get in even if the queue is full, so this
+            # is the only place that blocks for good — after the build has
+            # finished.
+            self.queue.put(_STOP)
+            self.thread.join(timeout)
+        if self.thread.is_alive():
+            sys.stderr.write(f"event pipeline: sinks still busy after {timeout:g}s, "
+                             f"{self.queue.qsize()} events not delivered\n")
+            return False
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as error:
+                sys.stderr.write(f"event sink {type(sink).__name__} failed to close: {error}\n")
+        if self.shed or self.dropped:
+            sys.stderr.write(
+                f"event pipeline: {self.submitted} events, {self.shed} shed of their output, "
+                f"{self.dropped} dropped (queue full), {self.lost} of them essential\n")
+        return True
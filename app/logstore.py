@@ -0,0 +1,187 @@
+import json
+import os
+import re
+
+import zstandard
+
+from app.config import LOGS_DIR
+from app.events import Sink
+from app.timeline import (TASK_END_EVENTS, classify_package, classify_phase,
+                          classify_stage, new_run_id)
+
+INDEX_FILE = "index.jsonl"
+
+
+def task_output(res):
+    """
+    Collects the command output of a task result, including every item of a
+    looped task.
+
+    Returns:
+        str: stdout followed by stderr, empty if the task printed nothing.
+    """
+    parts = []
+    for result in [res] + [r for r in res.get("results") or [] if isinstance(r, dict)]:
+        if result.get("stdout"):
+            parts.append(result["stdout"])
+        if result.get("stderr"):
+            parts.append("--- stderr ---\n" + result["stderr"])
+    return "\n".join(parts)
+
+
+class LogStore(Sink):
+    """
+    Streams every task's output into per-package, zstd-compressed log files
+    under LOGS_DIR/<run>/, one independent zstd frame per task, and keeps an
+    index of where each frame starts.
+
+    Concatenated frames are still a valid zstd stream (`zstd -dc
+    <package>.log.zst` shows the whole log), while the index lets search()
+    decompress only the frames of the package/phase being looked at.
+
+    Methods
+    -------
+    handle_batch(events):
+        Appends the output of every task-closing event in the batch.
+    close():
+        Closes the index.
+    """
+
+    def __init__(self, run_id=None, directory=LOGS_DIR, level: int = 6):
+        """
+        Args:
+            run_id (str, optional): Identifier of the run, shared with the
+                timeline. Defaults to the current time.
+            directory (str): Parent directory of every run's log store.
+            level (int): zstd compression level.
+        """
+        self.run_id = run_id or new_run_id()
+        self.path = os.path.join(directory, self.run_id)
+        os.makedirs(self.path, exist_ok=True)
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self.index = open(os.path.join(self.path, INDEX_FILE), "a", encoding="utf-8")
+        self.stage = None
+
+    def handle(self, event):
+        self.handle_batch([event])
+
+    def handle_batch(self, events):
+        frames = {}
+        for event in events:
+            if event.get("event") not in TASK_END_EVENTS:
+                continue
+            data = event.get("event_data") or {}
+            res = data.get("res") or {}
+            task_path = data.get("task_path", "")
+            # Tasks outside a package recipe (the kernel build, initramfs
+            # packing, ...) are filed under their stage instead.
+            self.stage = classify_stage(task_path, self.stage)
+            package = classify_package(task_path) or self.stage
+            status = TASK_END_EVENTS[event["event"]]
+            if isinstance(res.get("phases"), list):
+                # package_recipe: one frame per phase, as if each had been
+                # its own task.
+                parts = [(phase.get("name"), task_output(phase), phase.get("rc")) for phase in res["phases"]]
+            else:
+                parts = [(classify_phase(data.get("task")), task_output(res), None)]
+            for phase, output, rc in parts:
+                if not output and not res.get("output_shed"):
+                    continue
+                frames.setdefault(package, []).append(dict(
+                    package=package,
+                    phase=phase,
+                    task=data.get("task"),
+                    host=data.get("host"),
+                    status=status if rc is None else ("ok" if rc == 0 else "failed"),
+                    shed=bool(res.get("output_shed")),
+                    output=output,
+                ))
+        for package, entries in frames.items():
+            self.append(package, entries)
+
+    def append(self, package, entries):
+        filename = f"{package}.log.zst"
+        index_lines = []
+        with open(os.path.join(self.path, filename), "ab") as logfile:
+            offset = logfile.tell()
+            for entry in entries:
+                output = entry.pop("output")
+                if output and not output.endswith("\n"):
+                    output += "\n"
+                raw = output.encode("utf-8", "replace")
+                frame = self.compressor.compress(raw)
+                logfile.write(frame)
+                index_lines.append(json.dumps(dict(
+                    entry, file=filename, offset=offset, length=len(frame),
+                    size=len(raw), lines=raw.count(b"\n"))))
+                offset += len(frame)
+        self.index.write("".join(line + "\n" for line in index_lines))
+        self.index.flush()
+
+    def close(self):
+        self.index.close()
+
+
+def list_runs(directory=LOGS_DIR):
+    """
+    Returns the run identifiers that have a log store, oldest first.
+    """
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory)
+                  if os.path.isfile(os.path.join(directory, name, INDEX_FILE)))
+
+
+def load_index(run_id, directory=LOGS_DIR):
+    """
+    Reads a run's log index.
+
+    Returns:
+        list[dict]: One entry per stored frame, in the order they were written.
+    """
+    entries = []
+    with open(os.path.join(directory, run_id, INDEX_FILE), "r", encoding="utf-8") as infile:
+        for line in infile:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return entries
+
+
+def read_frame(run_id, entry, directory=LOGS_DIR):
+    """
+    Decompresses a single indexed frame.
+
+    Returns:
+        str: The task output stored in the frame.
+    """
+    with open(os.path.join(directory, run_id, entry["file"]), "rb") as logfile:
+        logfile.seek(entry["offset"])
+        frame = logfile.read(entry["length"])
+    return zstandard.ZstdDecompressor().decompress(frame).decode("utf-8", "replace")
+
+
+def search(run_id, package, pattern=None, phase=None, directory=LOGS_DIR):
+    """
+    Yields the stored output lines of one package, optionally filtered.
+
+    Only the frames of that package (and phase) are read and decompressed.
+
+    Args:
+        run_id (str): The run to search.
+        package (str): Package recipe name, or a stage name.
+        pattern (str | re.Pattern, optional): Regular expression lines must
+            match.
+        phase (str, optional): Restrict the search to one phase.
+
+    Yields:
+        tuple[dict, int, str]: The index entry, 1-based line number, line.
+    """
+    regex = re.compile(pattern) if pattern else None
+    for entry in load_index(run_id, directory):
+        if entry["package"] != package or (phase and entry["phase"] != phase):
+            continue
+        for number, line in enumerate(read_frame(run_id, entry, directory).splitlines(), 1):
+            if regex is None or regex.search(line):
+                yield entry, number, line
@@ -1,44 +1,79 @@
-from ansible_runner import Runner, RunnerConfig
-
-
-def al_event_handler(event):
-    if event['event'] in ['runner_on_ok', 'runner_item_on_failed', 'runner_item_on_ok']:
-        color = get_status(event['event'])
-        res = event.get("event_data").get('res')
-        handle_res_output(res, color, event['event'])
-
-
-def get_status(event_type):
-    if event_type in ['runner_on_ok', 'runner_item_on_ok']:
-        return "\033[92m[OK]\033[00m"  # green
-    else:
-        return "\033[91m[FAIL]\033[00m"  # red
+import os
 
+from ansible_runner import Runner, RunnerConfig
 
-def handle_res_output(res, color, event_type):
-    if res is not None:
-        if res.get('stdout'):
-            print(f"\33[33m{res.get('stdout')}\033[00m")
-        if res.get('stderr'):
-            print(res.get('stderr'))
-        if res.get('msg'):
-            print(f'{color} - Download url: {res.get("url")}{f" - {res.get('msg')
-                                                                   }" if event_type in ["runner_item_on_failed"] else ""}')
+from app.config import EVENTS_DIR, METRICS_FILE
+from app.events import EventPipeline
+from app.logstore import LogStore
+from app.sinks import ConsoleSink, JsonlSink, OpenMetricsSink
+from app.stages import (StageCheckpointSink, fingerprint_stages, load_checkpoints,
+                        plan_stages, write_resume_playbook)
+from app.timeline import TimelineRecorder, list_timelines, new_run_id
 
 
 class AnsibleRunner(Runner):
-    def __init__(self, **kwargs):
+    def __init__(self, from_stage=None, only_stage=None, **kwargs):
         print("Running AnsibleRunner")
 
+        self.fingerprints = fingerprint_stages(kwargs)
+        self.stages = plan_stages(self.fingerprints, load_checkpoints(),
+                                  from_stage=from_stage, only_stage=only_stage)
+        playbook = write_resume_playbook(self.stages) if self.stages else 'automated-linux.yaml'
+
         config = RunnerConfig(private_data_dir='playbooks',
-                              playbook='automated-linux.yaml', extravars=kwargs, quiet=True)
+                              playbook=playbook, extravars=kwargs, quiet=True)
         config.prepare()
         # to avoid ansible_runner's internal stdout dump
         config.suppress_ansible_output = True
 
         self.cofig = config
-        self.event_handler = al_event_handler
-        super().__init__(config=config, event_handler=al_event_handler)
+        self.pipeline = None
+        self.checkpoint_sink = None
+        self.event_handler = self.handle_event
+        super().__init__(config=config, event_handler=self.handle_event)
+
+    def build_sinks(self, run_id):
+        # The previous timeline has to be looked up before this run's own
+        # TimelineRecorder creates the newest file in the directory.
+        timelines = list_timelines()
+        baseline = timelines[-1] if timelines else None
+        return [
+            ConsoleSink(),
+            TimelineRecorder(run_id=run_id),
+            LogStore(run_id=run_id),
+            # Task output already goes to the compressed LogStore.
+            JsonlSink(os.path.join(EVENTS_DIR, f"{run_id}.jsonl"), keep_output=False),
+            OpenMetricsSink(METRICS_FILE, baseline_path=baseline),
+            self.checkpoint_sink,
+        ]
+
+    def handle_event(self, event):
+        # Called on ansible_runner's own event thread: anything slow here
+        # (a slow terminal, a full disk) stalls reading ansible's output and
+        # with it the build, so events are only queued here.
+        if self.pipeline is not None:
+            self.pipeline.submit(event)
+        return False
 
     def run(self):
-        super().run()
+        if not self.stages:
+            print("Every stage is up to date, nothing to run "
+                  "(use --from-stage/--only-stage to force one)")
+            return
+        print(f"Running stages: {', '.join(self.stages)}")
+
+        # Set up here rather than in __init__: Main builds the runner before
+        # the installer dialog, which can still be aborted.
+        run_id = new_run_id()
+        self.checkpoint_sink = StageCheckpointSink(self.fingerprints)
+        self.pipeline = EventPipeline(self.build_sinks(run_id)).start()
+        try:
+            super().run()
+        finally:
+            if self.pipeline.close():
+                # The last stage only counts as complete on ansible-playbook's
+                # own word, not just on not having seen a failed task.
+                self.checkpoint_sink.finish_run(
+                    self.status == "successful" and self.rc == 0 and not self.pipeline.lost)
+            print(f"Timeline and logs written for run {run_id} "
+                  "(python run.py report, python run.py logs <package>)")
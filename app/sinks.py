@@ -0,0 +1,226 @@
+import json
+import os
+import sys
+import time
+
+from app.events import Sink, shed_event
+from app.timeline import (TASK_END_EVENTS, classify_package, classify_stage,
+                          list_timelines, load_timeline)
+
+OK = "\033[92m[OK]\033[00m"  # green
+CHANGED = "\033[33m[CHANGED]\033[00m"  # yellow
+FAIL = "\033[91m[FAIL]\033[00m"  # red
+
+
+def task_label(data, stage):
+    """
+    Returns "<stage>/<package>: <task>" (or "<stage>: <task>" outside of a
+    package recipe) for a task event's event_data.
+    """
+    package = classify_package(data.get("task_path", ""))
+    where = f"{stage}/{package}" if package else stage
+    return f"{where}: {data.get('task')}"
+
+
+def tail(text, lines):
+    """
+    Returns the last `lines` lines of text.
+    """
+    return "\n".join((text or "").splitlines()[-lines:])
+
+
+class ConsoleSink(Sink):
+    """
+    Prints one status line per finished task instead of the task's whole
+    output; only failures get their stderr/stdout tail printed.
+
+    Methods
+    -------
+    format(event):
+        Returns the console text for an event, or None.
+    handle_batch(events):
+        Writes a whole batch to the stream with a single write.
+    """
+
+    def __init__(self, stream=None, tail_lines: int = 20):
+        """
+        Args:
+            stream (file, optional): Where to print. Defaults to sys.stdout.
+            tail_lines (int): Lines of output printed for a failed task.
+        """
+        self.stream = stream or sys.stdout
+        self.tail_lines = tail_lines
+        self.stage = None
+
+    def format(self, event):
+        event_type = event.get("event")
+        data = event.get("event_data") or {}
+        res = data.get("res") or {}
+        if event_type in TASK_END_EVENTS or event_type == "runner_item_on_failed":
+            self.stage = classify_stage(data.get("task_path", ""), self.stage)
+
+        if event_type == "runner_item_on_failed":
+            # get_url/package loops: keep the per-item failure visible, the
+            # final runner_on_failed for the loop only says "one item failed".
+            item = res.get("url") or res.get("item")
+            return f"{FAIL} {task_label(data, self.stage)} - {item} - {res.get('msg')}"
+        if event_type not in TASK_END_EVENTS or event_type == "runner_on_skipped":
+            return None
+
+        duration = data.get("duration")
+        took = f" ({duration:.1f}s)" if isinstance(duration, (int, float)) else ""
+        if event_type == "runner_on_ok":
+            status = CHANGED if res.get("changed") else OK
+            return f"{status} {task_label(data, self.stage)}{took}"
+
+        lines = [f"{FAIL} {task_label(data, self.stage)}{took}"]
+        if res.get("msg"):
+            lines.append(str(res.get("msg")))
+        for field in ("stderr", "stdout"):
+            if res.get(field):
+                lines.append(f"\33[33m{tail(res.get(field), self.tail_lines)}\033[00m")
+        package = classify_package(data.get("task_path", "")) or self.stage
+        lines.append(f"full output: python run.py logs {package}")
+        return "\n".join(lines)
+
+    def handle(self, event):
+        self.handle_batch([event])
+
+    def handle_batch(self, events):
+        text = [line for line in map(self.format, events) if line]
+        if text:
+            self.stream.write("\n".join(text) + "\n")
+            self.stream.flush()
+
+
+class JsonlSink(Sink):
+    """
+    Appends every event, as received, to a JSONL file.
+    """
+
+    def __init__(self, path, keep_output: bool = True):
+        """
+        Args:
+            path (str): The JSONL file to append to.
+            keep_output (bool): Whether to keep the stdout/stderr of task
+                results, or leave that to a LogStore.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.keep_output = keep_output
+        self.file = open(path, "a", encoding="utf-8")
+
+    def handle(self, event):
+        self.handle_batch([event])
+
+    def handle_batch(self, events):
+        if not self.keep_output:
+            events = map(shed_event, events)
+        self.file.write("".join(json.dumps(event, default=str) + "\n" for event in events))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class OpenMetricsSink(Sink):
+    """
+    Maintains an OpenMetrics textfile (node_exporter textfile-collector
+    format) with the build's progress and an ETA.
+
+    The ETA is based on the previous recorded timeline: once n tasks have
+    finished, the remaining time is what the tasks after the n-th took last
+    time. Without a previous run only progress counters are exported.
+
+    Methods
+    -------
+    handle_batch(events):
+        Updates the counters and rewrites the textfile once per batch.
+    render():
+        Returns the textfile contents.
+    """
+
+    def __init__(self, path, baseline_path=None):
+        """
+        Args:
+            path (str): The textfile to (atomically) rewrite.
+            baseline_path (str, optional): Timeline of a previous run to
+                estimate the remaining time from. Defaults to the latest
+                recorded timeline.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        if baseline_path is None:
+            timelines = list_timelines()
+            baseline_path = timelines[-1] if timelines else None
+        durations = [e.get("duration") or 0.0 for e in load_timeline(baseline_path)] if baseline_path else []
+        # remaining[n] = seconds the tasks after the n-th took last time
+        self.remaining = [sum(durations)]
+        for duration in durations:
+            self.remaining.append(self.remaining[-1] - duration)
+        self.started = time.time()
+        self.counts = {status: 0 for status in TASK_END_EVENTS.values()}
+        self.stage = None
+        self.finished = False
+
+    def handle_batch(self, events):
+        for event in events:
+            event_type = event.get("event")
+            data = event.get("event_data") or {}
+            if event_type in TASK_END_EVENTS:
+                self.counts[TASK_END_EVENTS[event_type]] += 1
+                self.stage = classify_stage(data.get("task_path", ""), self.stage)
+            elif event_type == "playbook_on_stats":
+                self.finished = True
+        self.write()
+
+    def render(self):
+        done = sum(self.counts.values())
+        expected = len(self.remaining) - 1
+        lines = [
+            "# HELP automated_linux_tasks Finished Ansible tasks by status.",
+            "# TYPE automated_linux_tasks counter",
+        ]
+        lines += [f'automated_linux_tasks_total{{status="{status}"}} {count}'
+                  for status, count in self.counts.items()]
+        lines += [
+            "# HELP automated_linux_elapsed_seconds Seconds since the run started.",
+            "# TYPE automated_linux_elapsed_seconds gauge",
+            f"automated_linux_elapsed_seconds {time.time() - self.started:.0f}",
+            "# HELP automated_linux_stage Stage of the task that finished last.",
+            "# TYPE automated_linux_stage gauge",
+            f'automated_linux_stage{{stage="{self.stage or "none"}"}} 1',
+            "# HELP automated_linux_finished Whether the run has finished.",
+            "# TYPE automated_linux_finished gauge",
+            f"automated_linux_finished {int(self.finished)}",
+        ]
+        if expected:
+            progress = 1.0 if self.finished else min(done / expected, 0.99)
+            eta = 0.0 if self.finished else max(self.remaining[min(done, expected)], 0.0)
+            lines += [
+                "# HELP automated_linux_tasks_expected Tasks the previous run finished.",
+                "# TYPE automated_linux_tasks_expected gauge",
+                f"automated_linux_tasks_expected {expected}",
+                "# HELP automated_linux_progress_ratio Estimated fraction of the run done.",
+                "# TYPE automated_linux_progress_ratio gauge",
+                f"automated_linux_progress_ratio {progress:.4f}",
+                "# HELP automated_linux_eta_seconds Estimated seconds until the run finishes.",
+                "# TYPE automated_linux_eta_seconds gauge",
+                f"automated_linux_eta_seconds {eta:.0f}",
+            ]
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        # Written to a temporary file and renamed so a collector scraping
+        # mid-write never sees a truncated file.
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as outfile:
+            outfile.write(self.render())
+        os.replace(tmp, self.path)
+
+    def handle(self, event):
+        self.handle_batch([event])
+
+    def close(self):
+        self.write()
@@ -0,0 +1,81 @@
+import json
+import os
+import shutil
+import subprocess
+
+import yaml
+
+from app.clone import clone_file
+from app.config import BUILD_IMAGES_DIR, SNAPSHOTS_DIR, VARS_FILE
+from app.stages import SETUP_STAGES, load_checkpoints, save_checkpoints
+from app.timeline import STAGES
+
+# Stages stage_snapshots.stages can take a snapshot after: not the setup
+# stages, which every run repeats anyway, nor the last one, which has no
+# stage after it to resume.
+SNAPSHOT_STAGES = [stage for stage in STAGES[:-1] if stage not in SETUP_STAGES]
+
+
+def list_snapshots(directory=SNAPSHOTS_DIR):
+    """
+    Returns the snapshot.json record of every stage snapshot taken by
+    playbooks/tasks/stage-snapshot.yaml, in pipeline order.
+    """
+    snapshots = []
+    for stage in STAGES:
+        try:
+            with open(os.path.join(directory, stage, "snapshot.json"), "r", encoding="utf-8") as infile:
+                snapshots.append(json.load(infile))
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+    return snapshots
+
+
+def build_container(vars_file=VARS_FILE):
+    with open(vars_file, "r", encoding="utf-8") as infile:
+        return yaml.safe_load(infile)["docker"]["container_name"]
+
+
+def restore_snapshot(stage, directory=SNAPSHOTS_DIR, build_images=BUILD_IMAGES_DIR):
+    """
+    Puts the disk images of a stage snapshot back in build-images/.
+
+    The build container is removed first: it still has the current images
+    attached (qemu-nbd, loop mounts) if the last run failed, and docker.yaml
+    creates it again on the next run. The checkpoints of every stage after
+    the snapshot are dropped, since the restored images no longer contain
+    their work.
+
+    Args:
+        stage (str): The stage whose snapshot to restore.
+
+    Returns:
+        dict | None: The snapshot's record, None if there is no snapshot of
+            that stage.
+    """
+    snapshot = next((s for s in list_snapshots(directory) if s["stage"] == stage), None)
+    if snapshot is None:
+        return None
+
+    if shutil.which("docker"):
+        subprocess.run(["docker", "rm", "--force", build_container()],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for image in snapshot["images"]:
+        target = os.path.join(build_images, image)
+        clone_file(os.path.join(directory, stage, image), f"{target}.restore")
+        os.replace(f"{target}.restore", target)
+
+    checkpoints = load_checkpoints()
+    for later in STAGES[STAGES.index(stage) + 1:]:
+        checkpoints.pop(later, None)
+    save_checkpoints(checkpoints)
+    return snapshot
+
+
+def print_snapshots(snapshots):
+    print(f"{'stage':10} {'taken':19} {'size GiB':>9} {'method':6}  images")
+    for snapshot in snapshots:
+        methods = set(snapshot["images"].values())
+        method = methods.pop() if len(methods) == 1 else "mixed"
+        print(f"{snapshot['stage']:10} {snapshot['taken']:19} {snapshot['bytes'] / 2**30:9.1f} {method:6}  "
+              f"{', '.join(snapshot['images'])}")
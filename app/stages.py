@@ -0,0 +1,218 @@
+import glob
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import yaml
+
+from app.config import CHECKPOINTS_FILE, PLAYBOOKS_DIR, VARS_FILE
+from app.events import Sink
+from app.timeline import STAGE_FILES, STAGES, TASK_END_EVENTS, classify_stage
+
+PIPELINE_PLAYBOOK = "automated-linux.yaml"
+RESUME_PLAYBOOK = ".resume-automated-linux.yaml"
+
+# Everything besides the shared vars file that decides what a stage
+# produces, relative to the playbooks directory. Package versions and URLs
+# are the import vars inside packages/toolchain.yaml and, for the userland,
+# in vars/build-packages.yaml.
+STAGE_INPUTS = {
+    "docker": ["docker.yaml", "templates/builder/*"],
+    "prepare": ["prepare.yaml", "tasks/jobserver.yaml", "tasks/root-image-nbd.yaml", "tasks/root-image-directory.yaml",
+                "library/image_state.py", "templates/rootfs/**/*"],
+    "prefetch": ["prefetch.yaml", "library/source_prefetch.py", "../sources.sha256", "../packages.txt"],
+    "toolchain": ["packages/toolchain.yaml", "packages/toolchain/*.yaml", "library/package_recipe.py",
+                  "library/source_extract.py", "module_utils/source_extract.py", "tasks/stage-snapshot.yaml"],
+    "kernel": ["kernel.yaml", "library/source_extract.py", "module_utils/source_extract.py",
+               "tasks/stage-snapshot.yaml"],
+    "build": ["packages/build.yaml", "packages/build-cache.yaml", "packages/build-lane.yaml",
+              "tasks/chroot-ccache.yaml", "tasks/stage-snapshot.yaml",
+              "packages/build/**/*", "library/package_recipe.py", "library/source_extract.py",
+              "module_utils/source_extract.py", "../vars/build-packages.yaml"],
+    "initramfs": ["initramfs.yaml", "library/elf_closure.py", "library/kmod_closure.py", "templates/initramfs/*",
+                  "templates/grub/*", "tasks/stage-snapshot.yaml"],
+    "qemu": ["qemu.yaml", "tasks/assemble-root-image.yaml", "export.yaml", "templates/boot-test.exp.j2"],
+}
+
+# docker.yaml registers the build container in the in-memory inventory,
+# prepare.yaml attaches and mounts the images and prefetch.yaml hands the
+# verified source checksums to the recipes: every later stage depends on
+# them having run in the same ansible-playbook invocation, so they are never
+# skipped when anything else runs.
+SETUP_STAGES = ["docker", "prepare", "prefetch"]
+
+
+def stage_files(stage, playbooks_dir=PLAYBOOKS_DIR):
+    """
+    Returns the input files of a stage, sorted so the fingerprint does not
+    depend on directory listing order.
+    """
+    files = set()
+    for pattern in STAGE_INPUTS[stage]:
+        files.update(p for p in glob.glob(os.path.join(playbooks_dir, pattern), recursive=True)
+                     if os.path.isfile(p))
+    return sorted(files)
+
+
+def fingerprint_stages(extravars=None, playbooks_dir=PLAYBOOKS_DIR, vars_file=VARS_FILE):
+    """
+    Computes a fingerprint per stage from the shared vars file, the extra
+    vars of the run and the stage's own playbooks, recipes and templates.
+
+    Fingerprints are chained — each one also covers the stage before it — so
+    a changed toolchain invalidates the kernel, the userland and everything
+    after them, not only its own checkpoint.
+
+    Returns:
+        dict: stage name -> hex digest.
+    """
+    previous = hashlib.sha256(json.dumps(extravars or {}, sort_keys=True).encode())
+    with open(vars_file, "rb") as infile:
+        previous.update(infile.read())
+
+    fingerprints = {}
+    for stage in STAGES:
+        digest = hashlib.sha256(previous.hexdigest().encode())
+        for path in stage_files(stage, playbooks_dir):
+            digest.update(os.path.relpath(path, playbooks_dir).encode() + b"\0")
+            with open(path, "rb") as infile:
+                digest.update(infile.read())
+        fingerprints[stage] = digest.hexdigest()
+        previous = digest
+    return fingerprints
+
+
+def load_checkpoints(path=CHECKPOINTS_FILE):
+    """
+    Returns the recorded stage checkpoints, or an empty dict if none exist.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as infile:
+            return json.load(infile)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_checkpoints(checkpoints, path=CHECKPOINTS_FILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as outfile:
+        json.dump(checkpoints, outfile, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def plan_stages(fingerprints, checkpoints, from_stage=None, only_stage=None):
+    """
+    Decides which stages a run has to execute.
+
+    Without options, every stage up to the first one whose fingerprint no
+    longer matches its checkpoint (or that never completed) is skipped.
+
+    Args:
+        fingerprints (dict): Current fingerprints, from fingerprint_stages().
+        checkpoints (dict): Recorded checkpoints, from load_checkpoints().
+        from_stage (str, optional): Run this stage and everything after it.
+        only_stage (str, optional): Run only this stage.
+
+    Returns:
+        list[str]: The stages to run, in pipeline order, setup stages
+            included; empty if everything is up to date.
+    """
+    if only_stage:
+        selected = [only_stage]
+    elif from_stage:
+        selected = STAGES[STAGES.index(from_stage):]
+    else:
+        stale = [stage for stage in STAGES
+                 if checkpoints.get(stage, {}).get("fingerprint") != fingerprints[stage]]
+        selected = STAGES[STAGES.index(stale[0]):] if stale else []
+
+    if not selected:
+        return []
+    return [stage for stage in STAGES if stage in selected or stage in SETUP_STAGES]
+
+
+def write_resume_playbook(stages, playbooks_dir=PLAYBOOKS_DIR):
+    """
+    Writes a copy of automated-linux.yaml that only imports the given stages.
+
+    Returns:
+        str: The playbook to run, relative to the playbooks directory —
+            automated-linux.yaml itself if every stage is selected.
+    """
+    with open(os.path.join(playbooks_dir, PIPELINE_PLAYBOOK), "r", encoding="utf-8") as infile:
+        imports = yaml.safe_load(infile)
+    if len(stages) == len(imports):
+        return PIPELINE_PLAYBOOK
+
+    selected = [entry for entry in imports
+                if STAGE_FILES.get(entry["ansible.builtin.import_playbook"]) in stages]
+    with open(os.path.join(playbooks_dir, RESUME_PLAYBOOK), "w", encoding="utf-8") as outfile:
+        outfile.write("# code: language=ansible\n"
+                      f"# Generated by app/stages.py from {PIPELINE_PLAYBOOK}; "
+                      f"stages: {', '.join(stages)}\n---\n")
+        yaml.safe_dump(selected, outfile, sort_keys=False)
+    return RESUME_PLAYBOOK
+
+
+class StageCheckpointSink(Sink):
+    """
+    Records a completion marker for each stage once the run has moved past
+    it without an unignored task failure. The last stage of the run is only
+    marked by finish_run(), once ansible-playbook itself has reported
+    success: a lost failure event must not mark a failed stage complete.
+
+    Methods
+    -------
+    handle(event):
+        Follows stage transitions and failures.
+    finish_run(successful):
+        Marks the last stage of the run complete if the run succeeded.
+    """
+
+    def __init__(self, fingerprints, path=CHECKPOINTS_FILE):
+        """
+        Args:
+            fingerprints (dict): Fingerprints of this run's stages.
+            path (str): The checkpoint file to update.
+        """
+        self.fingerprints = fingerprints
+        self.path = path
+        self.checkpoints = load_checkpoints(path)
+        self.stage = None
+        self.failed = False
+
+    def handle(self, event):
+        event_type = event.get("event")
+        data = event.get("event_data") or {}
+        if event_type in TASK_END_EVENTS or event_type == "playbook_on_task_start":
+            stage = classify_stage(data.get("task_path", ""), self.stage)
+            if stage in STAGES and stage != self.stage:
+                self.finish_stage()
+                self.stage = stage
+                # A stage that is running again is no longer complete until
+                # it finishes, even if its fingerprint has not changed.
+                if self.checkpoints.pop(stage, None) is not None:
+                    save_checkpoints(self.checkpoints, self.path)
+        if event_type in ("runner_on_failed", "runner_on_unreachable") and not data.get("ignore_errors"):
+            self.failed = True
+
+    def finish_run(self, successful):
+        """
+        Args:
+            successful (bool): Whether ansible-playbook exited successfully
+                and every task event reached this sink.
+        """
+        if successful:
+            self.finish_stage()
+
+    def finish_stage(self):
+        if self.stage is None or self.failed:
+            return
+        self.checkpoints[self.stage] = dict(
+            fingerprint=self.fingerprints[self.stage],
+            completed=datetime.now().isoformat(timespec="seconds"),
+        )
+        save_checkpoints(self.checkpoints, self.path)
+        self.stage = None
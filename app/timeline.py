@@ -0,0 +1,433 @@
+import json
+import os
+import re
+from datetime import datetime
+
+from app.config import TIMELINE_DIR
+from app.events import Sink
+
+# Imported playbooks of automated-linux.yaml, in pipeline order. Each task is
+# attributed to one of them by the file its task_path points at.
+STAGES = ["docker", "prepare", "prefetch", "toolchain", "kernel", "build", "initramfs", "qemu"]
+
+STAGE_FILES = {
+    "docker.yaml": "docker",
+    "prepare.yaml": "prepare",
+    "tasks/jobserver.yaml": "prepare",
+    "tasks/root-image-nbd.yaml": "prepare",
+    "tasks/root-image-directory.yaml": "prepare",
+    "prefetch.yaml": "prefetch",
+    "packages/toolchain.yaml": "toolchain",
+    "kernel.yaml": "kernel",
+    "packages/build.yaml": "build",
+    "packages/build-cache.yaml": "build",
+    "packages/build-lane.yaml": "build",
+    "tasks/chroot-ccache.yaml": "build",
+    "initramfs.yaml": "initramfs",
+    "qemu.yaml": "qemu",
+    "tasks/assemble-root-image.yaml": "qemu",
+    "export.yaml": "qemu",
+}
+
+# Task files imported by the plays of several stages. Their tasks belong to
+# the stage of the play importing them, which is the stage of the tasks
+# that ran just before.
+SHARED_TASK_FILES = ["tasks/stage-snapshot.yaml"]
+
+RECIPE_PATH = re.compile(r"packages/(toolchain|build)/([^/]+)\.yaml$")
+
+# Matched against the lowercased task name, first match wins. The build
+# recipes fold configure/make/install into a single chroot heredoc task, so
+# that combined form has to be checked before the plain "configure" prefix.
+PHASE_PREFIXES = [
+    ("download", "download"),
+    ("extract", "extract"),
+    ("configure, build and install", "build"),
+    ("configure", "configure"),
+    ("build", "make"),
+    ("install", "install"),
+    ("remove", "cleanup"),
+]
+
+TASK_END_EVENTS = {
+    "runner_on_ok": "ok",
+    "runner_on_failed": "failed",
+    "runner_on_skipped": "skipped",
+    "runner_on_unreachable": "unreachable",
+}
+
+
+def split_task_path(task_path):
+    """
+    Strips the line number and everything up to the playbooks/ directory off
+    an ansible_runner task_path.
+
+    Args:
+        task_path (str): e.g. "/src/playbooks/packages/build/zlib.yaml:12".
+
+    Returns:
+        str: The playbook-relative path, e.g. "packages/build/zlib.yaml".
+    """
+    path = (task_path or "").rsplit(":", 1)[0]
+    marker = "playbooks/"
+    if marker in path:
+        path = path[path.rindex(marker) + len(marker):]
+    return path
+
+
+def classify_stage(task_path, current=None):
+    """
+    Maps a task_path to the pipeline stage that imported it.
+
+    Args:
+        task_path (str): The task_path of a task event.
+        current (str, optional): The stage of the task before it, which
+            tasks of SHARED_TASK_FILES stay in.
+
+    Returns:
+        str: One of STAGES, or "other" for tasks outside the known playbooks.
+    """
+    path = split_task_path(task_path)
+    match = RECIPE_PATH.search(path)
+    if match:
+        return match.group(1)
+    if path in SHARED_TASK_FILES:
+        return current or "other"
+    return STAGE_FILES.get(path, "other")
+
+
+def classify_package(task_path):
+    """
+    Returns the package recipe a task belongs to (the recipe file's basename),
+    or None for stage-level tasks that are not part of any recipe.
+    """
+    match = RECIPE_PATH.search(split_task_path(task_path))
+    return match.group(2) if match else None
+
+
+def classify_phase(task_name):
+    """
+    Returns the recipe phase (download/extract/configure/make/install/...)
+    a task name describes, or "other".
+    """
+    name = (task_name or "").strip().lower()
+    for prefix, phase in PHASE_PREFIXES:
+        if name.startswith(prefix):
+            return phase
+    return "other"
+
+
+def parse_time(value):
+    """
+    Parses the ISO-8601 timestamps ansible_runner puts on its events.
+
+    Returns:
+        datetime | None: None if the value is missing or unparsable.
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def new_run_id():
+    """
+    Returns the identifier shared by every file a single run writes.
+    """
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+class TimelineRecorder(Sink):
+    """
+    Appends one JSON line per finished task (and per host) to a timeline file,
+    using the start/end timestamps ansible_runner attaches to every event.
+
+    Methods
+    -------
+    handle(event):
+        Records the event if it closes a task, otherwise only tracks the
+        start time of the task.
+    handle_batch(events):
+        Records a batch of events with a single write.
+    close():
+        Flushes and closes the timeline file.
+    """
+
+    def __init__(self, path=None, run_id=None):
+        """
+        Opens a new timeline file.
+
+        Args:
+            path (str, optional): Where to write the timeline. Defaults to a
+                file named after the run under TIMELINE_DIR.
+            run_id (str, optional): Identifier of the run. Defaults to the
+                current time.
+        """
+        self.run_id = run_id or new_run_id()
+        self.path = path or os.path.join(TIMELINE_DIR, f"{self.run_id}.jsonl")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.task_starts = {}
+        self.stage = None
+
+    def handle(self, event):
+        """
+        Records a timeline entry for task-closing events.
+
+        Args:
+            event (dict): An ansible_runner event.
+
+        Returns:
+            dict | None: The entry written, if any.
+        """
+        entry = self.track(event)
+        if entry is not None:
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+        return entry
+
+    def handle_batch(self, events):
+        entries = [entry for entry in map(self.track, events) if entry is not None]
+        if entries:
+            self.file.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            self.file.flush()
+
+    def track(self, event):
+        """
+        Remembers task start times and turns task-closing events into
+        timeline entries.
+
+        Returns:
+            dict | None: The entry for a task-closing event, None otherwise.
+        """
+        event_type = event.get("event")
+        data = event.get("event_data") or {}
+        if event_type == "playbook_on_task_start":
+            self.task_starts[data.get("task_uuid")] = event.get("created")
+            return None
+        if event_type not in TASK_END_EVENTS:
+            return None
+        return self.build_entry(event, TASK_END_EVENTS[event_type])
+
+    def build_entry(self, event, status):
+        """
+        Builds the timeline entry for a task-closing event.
+        """
+        data = event.get("event_data") or {}
+        task_path = data.get("task_path", "")
+        start = data.get("start") or self.task_starts.get(data.get("task_uuid"))
+        end = data.get("end") or event.get("created")
+        duration = data.get("duration")
+        if duration is None:
+            start_time, end_time = parse_time(start), parse_time(end)
+            duration = (end_time - start_time).total_seconds() if start_time and end_time else 0.0
+        res = data.get("res") or {}
+        self.stage = classify_stage(task_path, self.stage)
+        entry = dict(
+            run=self.run_id,
+            stage=self.stage,
+            play=data.get("play"),
+            task=data.get("task"),
+            task_path=split_task_path(task_path),
+            package=classify_package(task_path),
+            phase=classify_phase(data.get("task")),
+            host=data.get("host"),
+            status=status,
+            changed=bool(res.get("changed")),
+            start=start,
+            end=end,
+            duration=round(float(duration), 3),
+        )
+        if isinstance(res.get("phases"), list):
+            # A package_recipe task runs every phase of a package at once;
+            # keep their split so the report still shows it.
+            entry["phases"] = [dict(name=phase.get("name"), seconds=phase.get("seconds") or 0.0)
+                               for phase in res["phases"]]
+        return entry
+
+    def close(self):
+        """
+        Closes the timeline file.
+        """
+        self.file.close()
+
+
+def list_timelines(directory=TIMELINE_DIR):
+    """
+    Returns every recorded timeline in the directory, oldest first.
+    """
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(n for n in os.listdir(directory) if n.endswith(".jsonl"))
+    return [os.path.join(directory, n) for n in names]
+
+
+def load_timeline(path):
+    """
+    Reads a timeline file, skipping lines truncated by an interrupted run.
+
+    Returns:
+        list[dict]: The timeline entries, in the order they were recorded.
+    """
+    entries = []
+    with open(path, "r", encoding="utf-8") as infile:
+        for line in infile:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return entries
+
+
+def entry_phases(entry):
+    """
+    Splits a timeline entry's duration by phase.
+
+    Returns:
+        list[tuple[str, float]]: The entry's own phase and duration, or for
+            a package_recipe task the phases it reported plus the rest of the
+            task's time as "overhead" (module transfer, connection, result).
+    """
+    duration = entry.get("duration") or 0.0
+    if not entry.get("phases"):
+        return [(entry["phase"], duration)]
+    split = [(phase["name"], phase["seconds"]) for phase in entry["phases"]]
+    overhead = duration - sum(seconds for _, seconds in split)
+    return split + [("overhead", overhead)] if overhead > 0 else split
+
+
+def summarize(entries):
+    """
+    Aggregates a timeline into per-stage, per-package and per-phase totals.
+
+    Args:
+        entries (list[dict]): Timeline entries, as returned by load_timeline().
+
+    Returns:
+        dict: "stages", "packages" and "phases" map names to total seconds;
+            "package_phases" maps package to a phase -> seconds dict;
+            "stage_walls" maps stage to the elapsed time between its first
+            start and its last end (less than its total once its tasks run
+            on parallel build lanes); "wall" is the same for the whole run.
+    """
+    stages, packages, phases, package_phases = {}, {}, {}, {}
+    starts, ends, stage_spans = [], [], {}
+    for entry in entries:
+        duration = entry.get("duration") or 0.0
+        stages[entry["stage"]] = stages.get(entry["stage"], 0.0) + duration
+        for phase, seconds in entry_phases(entry):
+            phases[phase] = phases.get(phase, 0.0) + seconds
+            if entry.get("package"):
+                by_phase = package_phases.setdefault(entry["package"], {})
+                by_phase[phase] = by_phase.get(phase, 0.0) + seconds
+        if entry.get("package"):
+            package = entry["package"]
+            packages[package] = packages.get(package, 0.0) + duration
+        start, end = parse_time(entry.get("start")), parse_time(entry.get("end"))
+        if start and end:
+            starts.append(start)
+            ends.append(end)
+            first, last = stage_spans.get(entry["stage"], (start, end))
+            stage_spans[entry["stage"]] = (min(first, start), max(last, end))
+
+    wall = (max(ends) - min(starts)).total_seconds() if starts and ends else sum(stages.values())
+    stage_walls = {stage: (last - first).total_seconds() for stage, (first, last) in stage_spans.items()}
+    return dict(stages=stages, packages=packages, phases=phases,
+                package_phases=package_phases, stage_walls=stage_walls, wall=wall)
+
+
+def diff_totals(current, baseline, min_seconds=30.0, min_ratio=0.10):
+    """
+    Compares two name -> seconds mappings.
+
+    Args:
+        current (dict): Totals of the run being reported.
+        baseline (dict): Totals of the run to compare against.
+        min_seconds (float): Ignore changes smaller than this many seconds.
+        min_ratio (float): Ignore changes smaller than this fraction of the
+            baseline time.
+
+    Returns:
+        list[tuple]: (name, baseline, current, delta) tuples for every
+            significant change, biggest slowdown first.
+    """
+    changes = []
+    for name in set(current) | set(baseline):
+        before, after = baseline.get(name, 0.0), current.get(name, 0.0)
+        delta = after - before
+        if abs(delta) < min_seconds:
+            continue
+        if before and abs(delta) / before < min_ratio:
+            continue
+        changes.append((name, before, after, delta))
+    return sorted(changes, key=lambda change: change[3], reverse=True)
+
+
+def format_duration(seconds):
+    """
+    Formats seconds as h:mm:ss.
+    """
+    seconds = int(round(seconds))
+    sign = "-" if seconds < 0 else ""
+    hours, rest = divmod(abs(seconds), 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{sign}{hours}:{minutes:02d}:{secs:02d}"
+
+
+def print_report(path, baseline_path=None, top=15):
+    """
+    Prints the slowest packages, per-stage totals and, if a baseline timeline
+    is given, the regressions against it.
+
+    Args:
+        path (str): The timeline to report on.
+        baseline_path (str, optional): An earlier timeline to diff against.
+        top (int): How many packages to list.
+    """
+    summary = summarize(load_timeline(path))
+    print(f"\33[33mTimeline {path}\033[00m (wall time {format_duration(summary['wall'])})")
+
+    print(f"\nStages:{'task time':>18} {'':>6} {'wall':>10}")
+    total = sum(summary["stages"].values()) or 1.0
+    ordered = STAGES + sorted(set(summary["stages"]) - set(STAGES))
+    for stage in ordered:
+        if stage in summary["stages"]:
+            seconds = summary["stages"][stage]
+            wall = summary["stage_walls"].get(stage, seconds)
+            # Task time is what the stage's tasks take back to back, i.e.
+            # run serially; only parallel build lanes bring the wall below it.
+            parallel = f"  ({seconds / wall:.1f}x parallel)" if wall and seconds / wall >= 1.1 else ""
+            print(f"  {stage:<12} {format_duration(seconds):>10} {seconds / total:6.1%} "
+                  f"{format_duration(wall):>10}{parallel}")
+
+    # Apart from the build lanes every stage runs serially, so the critical
+    # path is mostly the whole sequence — what matters is which packages
+    # and phases dominate it.
+    print(f"\nSlowest packages (top {top}):")
+    slowest = sorted(summary["packages"].items(), key=lambda item: item[1], reverse=True)[:top]
+    for package, seconds in slowest:
+        by_phase = summary["package_phases"][package]
+        phases = ", ".join(f"{phase} {format_duration(s)}" for phase, s in
+                           sorted(by_phase.items(), key=lambda item: item[1], reverse=True)
+                           if s >= 1.0)
+        print(f"  {package:<24} {format_duration(seconds):>10}  {phases}")
+
+    print("\nPhases:")
+    for phase, seconds in sorted(summary["phases"].items(), key=lambda item: item[1], reverse=True):
+        print(f"  {phase:<12} {format_duration(seconds):>10}")
+
+    if baseline_path:
+        baseline = summarize(load_timeline(baseline_path))
+        print(f"\nChanges against {baseline_path}:")
+        changes = [("stage", *change) for change in diff_totals(summary["stages"], baseline["stages"])]
+        changes += [("wall", *change) for change in
+                    diff_totals(summary["stage_walls"], baseline["stage_walls"])]
+        changes += [("package", *change) for change in diff_totals(summary["packages"], baseline["packages"])]
+        if not changes:
+            print("  no significant changes")
+        for kind, name, before, after, delta in changes:
+            color = "\033[91m" if delta > 0 else "\033[92m"
+            print(f"  {kind:<8} {name:<24} {format_duration(before):>10} -> "
+                  f"{format_duration(after):>10} {color}{'+' if delta > 0 else ''}{format_duration(delta)}\033[00m")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Synthetic event-stream benchmark for AnsibleRunner's event handling.
+
+Replays a stream of task events shaped like a package build (a few tasks
+with megabytes of `make -j` output, most with little) through:
+
+  before: the old synchronous handler, which print()ed every task's full
+          stdout/stderr on ansible_runner's event thread;
+  after:  EventPipeline.submit(), with the console, timeline and JSONL
+          sinks draining in the background.
+
+The console is a throttled stream standing in for a slow terminal or SSH
+session. What matters is "producer" time: how long ansible_runner's event
+thread (and so the build) was blocked.
+
+    python benchmarks/event_pipeline.py --tasks 400 --terminal-kbps 2048
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.events import EventPipeline  # noqa: E402
+from app.sinks import ConsoleSink, JsonlSink  # noqa: E402
+from app.timeline import TimelineRecorder  # noqa: E402
+
+
+class SlowStream:
+    """
+    A write-only stream limited to a fixed throughput.
+    """
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self.written = 0
+
+    def write(self, text):
+        self.written += len(text)
+        time.sleep(len(text) / self.bytes_per_second)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def legacy_handler(event, stream):
+    """
+    The handler AnsibleRunner used before the event pipeline: every task's
+    whole output, printed synchronously.
+    """
+    if event['event'] in ['runner_on_ok', 'runner_item_on_failed', 'runner_item_on_ok']:
+        res = event.get("event_data").get('res')
+        if res is not None:
+            if res.get('stdout'):
+                print(f"\33[33m{res.get('stdout')}\033[00m", file=stream)
+            if res.get('stderr'):
+                print(res.get('stderr'), file=stream)
+
+
+def synthetic_events(tasks, big_every, big_bytes, small_bytes):
+    """
+    Builds task start/ok event pairs; every `big_every`-th task carries
+    `big_bytes` of output (a compiler run), the rest `small_bytes`.
+    """
+    line = "gcc -O2 -pipe -c -o obj/file.o src/file.c -I include -DHAVE_CONFIG_H\n"
+    events = []
+    for n in range(tasks):
+        size = big_bytes if n % big_every == 0 else small_bytes
+        data = dict(task=f"Configure, build and install pkg{n}",
+                    task_path=f"/src/playbooks/packages/build/pkg{n}.yaml:30",
+                    task_uuid=str(n), play="Build userland inside chroot", host="build",
+                    start="2026-01-01T00:00:00", end="2026-01-01T00:00:01", duration=1.0)
+        events.append(dict(event="playbook_on_task_start", created="2026-01-01T00:00:00",
+                           event_data=data))
+        res = dict(changed=True, rc=0, stdout=line * (size // len(line)), stderr="")
+        events.append(dict(event="runner_on_ok", created="2026-01-01T00:00:01",
+                           event_data=dict(data, res=res)))
+    return events
+
+
+def bench_before(events, stream):
+    start = time.perf_counter()
+    for event in events:
+        legacy_handler(event, stream)
+    return time.perf_counter() - start
+
+
+def bench_after(events, stream, workdir):
+    pipeline = EventPipeline([
+        ConsoleSink(stream=stream),
+        TimelineRecorder(path=os.path.join(workdir, "timeline.jsonl")),
+        JsonlSink(os.path.join(workdir, "events.jsonl")),
+    ]).start()
+    start = time.perf_counter()
+    for event in events:
+        pipeline.submit(event)
+    producer = time.perf_counter() - start
+    pipeline.close(timeout=600)
+    return producer, time.perf_counter() - start, pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tasks", type=int, default=400)
+    parser.add_argument("--big-every", type=int, default=20)
+    parser.add_argument("--big-kb", type=int, default=4096)
+    parser.add_argument("--small-kb", type=int, default=4)
+    parser.add_argument("--terminal-kbps", type=int, default=2048,
+                        help="throughput of the simulated terminal")
+    args = parser.parse_args()
+
+    events = synthetic_events(args.tasks, args.big_every, args.big_kb * 1024, args.small_kb * 1024)
+    total_mb = sum(len((e["event_data"].get("res") or {}).get("stdout", "")) for e in events) / 2**20
+    print(f"{len(events)} events, {total_mb:.1f} MiB of task output, "
+          f"terminal at {args.terminal_kbps} KiB/s")
+
+    before = bench_before(events, SlowStream(args.terminal_kbps * 1024))
+    print(f"before: handler blocked {before:8.3f}s  ({len(events) / before:10.0f} events/s)")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        producer, total, pipeline = bench_after(events, SlowStream(args.terminal_kbps * 1024), workdir)
+    print(f"after:  handler blocked {producer:8.3f}s  ({len(events) / producer:10.0f} events/s), "
+          f"sinks drained in {total:.3f}s, {pipeline.shed} shed, {pipeline.dropped} dropped")
+
+
+if __name__ == "__main__":
+    main()
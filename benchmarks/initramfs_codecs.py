@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Size, pack time and in-guest unpack time of each initramfs codec.
+
+initramfs.yaml run with `-e initramfs_benchmark=true` packs the same cpio
+with every codec of initramfs_compression into build-images/initramfs-bench
+and records each image's size and compression time in pack.jsonl. This
+boots the kernel once per image (QEMU direct kernel boot, no disk) and
+reads how long the kernel took to unpack it off the console: from "Trying
+to unpack rootfs image as initramfs" to "Freeing initrd memory", both
+timestamped by printk. QEMU is stopped right there, before /init runs.
+
+    python benchmarks/initramfs_codecs.py
+    python benchmarks/initramfs_codecs.py --boots 5 --accel tcg --cpu max
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import threading
+
+BUILD_IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "build-images")
+TIMESTAMP = re.compile(r"^\[\s*(\d+\.\d+)\]")
+UNPACK_START = "Trying to unpack rootfs image as initramfs"
+UNPACK_END = "Freeing initrd memory"
+
+
+def unpack_seconds(image, initramfs, args):
+    """
+    Boots `image` with `initramfs` and returns the seconds the kernel spent
+    unpacking it, None if the console never showed both messages.
+    """
+    command = [
+        args.qemu, "-M", "virt", "-cpu", args.cpu, "-accel", args.accel, "-m", args.memory,
+        "-kernel", image, "-initrd", initramfs, "-nographic", "-no-reboot",
+        "-append", "console=ttyAMA0 printk.time=1 panic=-1",
+    ]
+    started = None
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL,
+                          text=True, errors="replace") as qemu:
+        # A kernel that never gets there is killed, which ends the loop.
+        timer = threading.Timer(args.timeout, qemu.kill)
+        timer.start()
+        try:
+            for line in qemu.stdout:
+                stamp = TIMESTAMP.match(line.strip())
+                if not stamp:
+                    continue
+                if UNPACK_START in line:
+                    started = float(stamp.group(1))
+                elif UNPACK_END in line and started is not None:
+                    return float(stamp.group(1)) - started
+            return None
+        finally:
+            timer.cancel()
+            qemu.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--build-images", default=BUILD_IMAGES)
+    parser.add_argument("--boots", type=int, default=3, help="boots per codec; the median is reported")
+    parser.add_argument("--qemu", default="qemu-system-aarch64")
+    parser.add_argument("--accel", default="hvf")
+    parser.add_argument("--cpu", default="host")
+    parser.add_argument("--memory", default="2048")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    bench = os.path.join(args.build_images, "initramfs-bench")
+    with open(os.path.join(bench, "pack.jsonl"), encoding="utf-8") as infile:
+        packs = [json.loads(line) for line in infile if line.strip()]
+
+    print(f"{'codec':6} {'level':>5} {'size MiB':>9} {'pack s':>7} {'unpack s':>9}")
+    for pack in packs:
+        initramfs = os.path.join(bench, f"initramfs-{pack['codec']}.img")
+        timings = [unpack_seconds(os.path.join(args.build_images, "Image"), initramfs, args)
+                   for _ in range(args.boots)]
+        timings = [seconds for seconds in timings if seconds is not None]
+        unpack = f"{statistics.median(timings):9.3f}" if timings else f"{'-':>9}"
+        print(f"{pack['codec']:6} {pack['level']:5} {pack['bytes'] / 2**20:9.1f} "
+              f"{pack['pack_seconds']:7.2f} {unpack}")
+
+
+if __name__ == "__main__":
+    main()
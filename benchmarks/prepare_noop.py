@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Wall time of a no-op prepare.yaml rerun.
+
+Runs docker.yaml + prepare.yaml once so the images exist, are attached and
+mounted, then times --runs more runs of the same, where prepare.yaml has
+nothing left to do. Each run also pays for ansible-playbook's startup and
+docker.yaml; a docker.yaml-only run, timed the same way, measures exactly
+that and is subtracted. The tasks prepare.yaml still ran (or reported
+changed) on a rerun come from the play recap.
+
+    python benchmarks/prepare_noop.py
+    python benchmarks/prepare_noop.py --runs 10
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import tempfile
+import time
+
+import yaml
+
+PLAYBOOKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "playbooks")
+RECAP = re.compile(r"^(\S+)\s+:\s+ok=(\d+)\s+changed=(\d+).*?skipped=(\d+)", re.MULTILINE)
+
+
+def write_playbook(path, playbooks):
+    with open(path, "w", encoding="utf-8") as outfile:
+        yaml.safe_dump([{"ansible.builtin.import_playbook": os.path.join(PLAYBOOKS_DIR, playbook)}
+                        for playbook in playbooks], outfile, sort_keys=False)
+
+
+def run_playbook(path, args):
+    """
+    Runs one playbook and returns its wall time and the recap of the build
+    container: {"ok": n, "changed": n, "skipped": n}.
+    """
+    env = dict(os.environ, ANSIBLE_LIBRARY=os.path.join(PLAYBOOKS_DIR, "library"),
+               ANSIBLE_MODULE_UTILS=os.path.join(PLAYBOOKS_DIR, "module_utils"))
+    command = ["ansible-playbook", path] + [value for extra in args.extra_vars for value in ("-e", extra)]
+    start = time.perf_counter()
+    # From the top of the repository, for its ansible.cfg.
+    result = subprocess.run(command, env=env, cwd=os.path.join(PLAYBOOKS_DIR, ".."), check=True,
+                            capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    recap = {host: dict(ok=int(ok), changed=int(changed), skipped=int(skipped))
+             for host, ok, changed, skipped in RECAP.findall(result.stdout)}
+    return seconds, next((counts for host, counts in recap.items() if host != "localhost"), {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("-e", "--extra-vars", action="append", default=[],
+                        help="passed on to ansible-playbook")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        docker = os.path.join(tmp, "docker.yaml")
+        prepare = os.path.join(tmp, "prepare.yaml")
+        write_playbook(docker, ["docker.yaml"])
+        write_playbook(prepare, ["docker.yaml", "prepare.yaml"])
+
+        first, _ = run_playbook(prepare, args)
+        baseline = statistics.median(run_playbook(docker, args)[0] for _ in range(args.runs))
+        reruns = [run_playbook(prepare, args) for _ in range(args.runs)]
+
+    seconds = [rerun - baseline for rerun, _ in reruns]
+    recap = reruns[-1][1]
+    print(f"first run (docker.yaml + prepare.yaml): {first:8.2f}s")
+    print(f"docker.yaml alone, median of {args.runs}:   {baseline:8.2f}s")
+    print(f"no-op prepare.yaml, median of {args.runs}:  {statistics.median(seconds):8.2f}s  "
+          f"(min {min(seconds):.2f}s, max {max(seconds):.2f}s)")
+    print(f"prepare.yaml tasks on a rerun: ok={recap.get('ok', '-')} changed={recap.get('changed', '-')} "
+          f"skipped={recap.get('skipped', '-')}")
+
+
+if __name__ == "__main__":
+    main()
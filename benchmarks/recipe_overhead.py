@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Per-package Ansible overhead of the package recipes, old and new shape.
+
+Generates a playbook of N no-op packages (a tiny tarball whose "build" is
+`true`) in both recipe shapes and times ansible-playbook on each:
+
+  before: four tasks per package, as the recipes used to be written
+          (get_url, tar in a shell task, the build heredoc, file absent);
+  after:  one package_recipe task per package doing all four.
+
+Since nothing is built, the wall time is almost entirely Ansible's own
+cost: templating, module transfer and the connection round-trips. Run it
+against the build container to include the docker connection:
+
+    python benchmarks/recipe_overhead.py --packages 50
+    python benchmarks/recipe_overhead.py --packages 50 \\
+        --host automated-linux-build --connection community.docker.docker
+"""
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+import yaml
+
+PLAYBOOKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "playbooks")
+
+
+def setup_play(host, workdir, packages):
+    """
+    Creates one small tarball per package on the target.
+    """
+    return dict(
+        name="Create the benchmark tarballs",
+        hosts=host,
+        gather_facts=False,
+        tasks=[dict(
+            name="Create tarballs",
+            **{"ansible.builtin.shell": f"""
+set -e
+rm -rf {workdir}
+mkdir -p {workdir}/src {workdir}/sources
+for n in $(seq 0 {packages - 1}); do
+  mkdir -p {workdir}/src/pkg$n-1.0
+  echo pkg$n > {workdir}/src/pkg$n-1.0/README
+  tar cf {workdir}/src/pkg$n-1.0.tar -C {workdir}/src pkg$n-1.0
+done
+"""},
+        )],
+    )
+
+
+def legacy_tasks(n, workdir):
+    url = f"file://{workdir}/src/pkg{n}-1.0.tar"
+    tarball = f"{workdir}/sources/pkg{n}-1.0.tar"
+    return [
+        {"name": f"Download pkg{n} package",
+         "ansible.builtin.get_url": dict(url=url, dest=tarball),
+         "register": "get_url_result", "retries": 5, "delay": 10,
+         "until": "get_url_result is succeeded"},
+        {"name": f"Extract pkg{n} package",
+         "ansible.builtin.shell": f"[ -d {workdir}/sources/pkg{n}-1.0 ] || tar xf {tarball} -C {workdir}/sources\n",
+         "args": dict(executable="/bin/bash")},
+        {"name": f"Configure, build and install pkg{n}",
+         "ansible.builtin.shell": f"set -e\n/bin/bash <<'EOF'\ncd {workdir}/sources/pkg{n}-1.0\ntrue\nEOF\n",
+         "args": dict(executable="/bin/bash")},
+        {"name": f"Remove pkg{n} source directory",
+         "ansible.builtin.file": dict(state="absent", path=f"{workdir}/sources/pkg{n}-1.0")},
+    ]
+
+
+def recipe_tasks(n, workdir):
+    return [
+        {"name": f"Configure, build and install pkg{n}",
+         "package_recipe": dict(
+             name=f"pkg{n}",
+             url=f"file://{workdir}/src/pkg{n}-1.0.tar",
+             version=f"pkg{n}-1.0",
+             sources_dir=f"{workdir}/sources",
+             chdir=f"{workdir}/sources/pkg{n}-1.0",
+             phases=[dict(name="build", script="true\n")],
+         )},
+    ]
+
+
+def write_playbook(path, host, workdir, packages, tasks):
+    plays = [
+        setup_play(host, workdir, packages),
+        dict(name="Build the benchmark packages", hosts=host, gather_facts=False,
+             tasks=[task for n in range(packages) for task in tasks(n, workdir)]),
+    ]
+    with open(path, "w", encoding="utf-8") as outfile:
+        yaml.safe_dump(plays, outfile, sort_keys=False)
+
+
+def run_playbook(path, args):
+    """
+    Runs one playbook, without console output, and returns its wall time.
+    """
+    env = dict(os.environ, ANSIBLE_LIBRARY=os.path.join(PLAYBOOKS_DIR, "library"),
+               ANSIBLE_MODULE_UTILS=os.path.join(PLAYBOOKS_DIR, "module_utils"),
+               ANSIBLE_STDOUT_CALLBACK="ansible.builtin.null")
+    command = ["ansible-playbook", "-i", f"{args.host},", "-c", args.connection, path]
+    start = time.perf_counter()
+    subprocess.run(command, env=env, check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--packages", type=int, default=50)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--connection", default="local",
+                        help="e.g. community.docker.docker for the build container")
+    parser.add_argument("--workdir", default="/tmp/recipe-overhead",
+                        help="scratch directory on the target")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        timings = {}
+        for label, tasks in (("setup", lambda n, workdir: []), ("before", legacy_tasks),
+                             ("after", recipe_tasks)):
+            path = os.path.join(tmp, f"{label}.yaml")
+            write_playbook(path, args.host, args.workdir, args.packages, tasks)
+            timings[label] = run_playbook(path, args)
+
+    print(f"{args.packages} packages on {args.host} ({args.connection})")
+    for label, tasks_per_package in (("before", 4), ("after", 1)):
+        # Every run pays for ansible-playbook's startup and the setup play;
+        # the empty "setup" run measures exactly that.
+        seconds = timings[label] - timings["setup"]
+        print(f"{label + ':':7} {tasks_per_package} task(s)/package  {seconds:8.2f}s  "
+              f"({seconds / args.packages * 1000:7.1f} ms/package)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Wall time of source_extract with and without the extracted tree cache.
+
+Times, per tarball and as the median of --runs runs, the three things the
+cache changes: a plain extraction (extract_cache.enabled: false), the first
+extraction with the cache, which also writes the tree into it, and every
+later one, which copies the tree from the cache instead of decompressing.
+Everything happens under --dir, which should be on the filesystem the
+builds use (the sources image is ext4, where the copy is a real cp -a, not
+a reflink). The cache pays off once a tarball is reused more often than
+the break-even count printed at the end.
+
+    python benchmarks/source_extract.py linux-6.12.tar.xz gcc-14.2.0.tar.xz
+    python benchmarks/source_extract.py --dir /mnt/automated-linux/sources/.bench --runs 5 *.tar.*
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "playbooks", "module_utils"))
+
+from source_extract import extract  # noqa: E402
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    if result["rc"] != 0:
+        raise RuntimeError(result["stderr"])
+    return time.perf_counter() - start
+
+
+def measure(tarball, workdir, runs):
+    """
+    Returns the median seconds of a plain extraction, a first extraction
+    into the cache and a copy from the cache.
+    """
+    plain, fill, reuse = [], [], []
+    for _ in range(runs):
+        dest, cache = os.path.join(workdir, "dest"), os.path.join(workdir, "cache")
+        for path in (dest, cache):
+            shutil.rmtree(path, ignore_errors=True)
+            os.makedirs(path)
+        # Drop what the previous run wrote first, so every sample starts
+        # with the same dirty page cache.
+        os.sync()
+        plain.append(timed(extract, tarball, dest))
+        shutil.rmtree(dest)
+        os.makedirs(dest)
+        os.sync()
+        fill.append(timed(extract, tarball, dest, cache=cache))
+        shutil.rmtree(dest)
+        os.makedirs(dest)
+        os.sync()
+        reuse.append(timed(extract, tarball, dest, cache=cache))
+    return statistics.median(plain), statistics.median(fill), statistics.median(reuse)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("tarballs", nargs="+")
+    parser.add_argument("--dir", help="scratch directory (default: a temporary one)")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    totals = [0.0, 0.0, 0.0]
+    print(f"{'tarball':40} {'plain':>8} {'1st cached':>10} {'reuse':>8}")
+    for tarball in args.tarballs:
+        with tempfile.TemporaryDirectory(dir=args.dir) as workdir:
+            seconds = measure(os.path.abspath(tarball), workdir, args.runs)
+        totals = [total + value for total, value in zip(totals, seconds)]
+        print(f"{os.path.basename(tarball):40} {seconds[0]:7.2f}s {seconds[1]:9.2f}s {seconds[2]:7.2f}s")
+
+    plain, fill, reuse = totals
+    print(f"{'total':40} {plain:7.2f}s {fill:9.2f}s {reuse:7.2f}s")
+    if reuse < plain:
+        print(f"each reuse saves {plain - reuse:.2f}s, the first extraction costs {fill - plain:.2f}s more: "
+              f"the cache breaks even after {(fill - plain) / (plain - reuse):.1f} reuses")
+    else:
+        print(f"copying from the cache is {reuse - plain:.2f}s slower than extracting: it never pays off here")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/python3
+# Used by initramfs.yaml in place of running `chroot <root> ldd` per binary.
+import glob
+import os
+import shutil
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ansible.module_utils.basic import AnsibleModule
+
+DOCUMENTATION = r"""
+module: elf_closure
+short_description: Copy binaries and their shared-library closure out of a root image
+description:
+  - Reads C(PT_INTERP), C(DT_NEEDED), C(DT_RPATH) and C(DT_RUNPATH) straight
+    from the ELF headers of every binary and library, resolves each needed
+    library the way the dynamic loader would (RPATH, RUNPATH, the image's
+    C(ld.so.conf), then the default directories), all inside I(root), and
+    copies the whole closure to the same paths under I(dest).
+  - Nothing from the image is executed, so this works for images of any
+    architecture.
+  - Files are copied dereferenced (a library reached through a symlink is
+    copied as a regular file under the symlink's name), with mode, owner
+    and times preserved. Files already in I(dest) are left alone.
+options:
+  root:
+    type: path
+    required: true
+  binaries:
+    description: Absolute paths inside I(root); missing ones are skipped.
+    type: list
+    elements: str
+    required: true
+  dest:
+    type: path
+    required: true
+  threads:
+    description: Parallel copies.
+    type: int
+    default: 8
+"""
+
+RETURN = r"""
+copied:
+  description: Paths (inside the image) copied to I(dest).
+  type: list
+unresolved:
+  description: C(<binary>: <library>) for every needed library that was not found.
+  type: list
+seconds:
+  type: float
+"""
+
+PT_LOAD, PT_DYNAMIC, PT_INTERP = 1, 2, 3
+DT_NULL, DT_NEEDED, DT_STRTAB, DT_STRSZ, DT_RPATH, DT_RUNPATH = 0, 1, 5, 10, 15, 29
+
+
+class Elf:
+    """
+    The dynamic-linking view of one ELF file: its class and machine, its
+    interpreter and its DT_NEEDED/DT_RPATH/DT_RUNPATH entries.
+    """
+
+    def __init__(self, path):
+        self.interp = None
+        self.needed, self.rpath, self.runpath = [], [], []
+        with open(path, "rb") as infile:
+            ident = infile.read(64)
+            if len(ident) < 52 or ident[:4] != b"\x7fELF":
+                raise ValueError(f"{path}: not an ELF file")
+            self.elf_class = ident[4]
+            order = "<" if ident[5] == 1 else ">"
+            self.machine = struct.unpack_from(order + "H", ident, 18)[0]
+            if self.elf_class == 2:
+                phoff, = struct.unpack_from(order + "Q", ident, 32)
+                phentsize, phnum = struct.unpack_from(order + "HH", ident, 54)
+                phdr, dyn = order + "IIQQQQQQ", order + "qQ"
+            else:
+                phoff, = struct.unpack_from(order + "I", ident, 28)
+                phentsize, phnum = struct.unpack_from(order + "HH", ident, 42)
+                phdr, dyn = order + "IIIIIIII", order + "iI"
+
+            loads, dynamic = [], None
+            for index in range(phnum):
+                infile.seek(phoff + index * phentsize)
+                fields = struct.unpack(phdr, infile.read(struct.calcsize(phdr)))
+                if self.elf_class == 2:
+                    p_type, _, offset, vaddr, _, filesz = fields[:6]
+                else:
+                    p_type, offset, vaddr, _, filesz = fields[:5]
+                if p_type == PT_LOAD:
+                    loads.append((vaddr, offset, filesz))
+                elif p_type == PT_DYNAMIC:
+                    dynamic = (offset, filesz)
+                elif p_type == PT_INTERP:
+                    infile.seek(offset)
+                    self.interp = infile.read(filesz).split(b"\0", 1)[0].decode()
+            if dynamic is None:
+                return
+
+            infile.seek(dynamic[0])
+            data = infile.read(dynamic[1])
+            entries = []
+            for tag, value in struct.iter_unpack(dyn, data[:len(data) - len(data) % struct.calcsize(dyn)]):
+                if tag == DT_NULL:
+                    break
+                entries.append((tag, value))
+            tags = dict(entries)
+            if DT_STRTAB not in tags:
+                return
+            # DT_STRTAB is an address; find the file offset it is loaded from.
+            strtab = next((offset + tags[DT_STRTAB] - vaddr for vaddr, offset, filesz in loads
+                           if vaddr <= tags[DT_STRTAB] < vaddr + filesz), None)
+            if strtab is None:
+                return
+            infile.seek(strtab)
+            strings = infile.read(tags.get(DT_STRSZ, 65536))
+
+        def string(offset):
+            return strings[offset:strings.index(b"\0", offset)].decode()
+
+        for tag, value in entries:
+            if tag == DT_NEEDED:
+                self.needed.append(string(value))
+            elif tag == DT_RPATH:
+                self.rpath.extend(string(value).split(":"))
+            elif tag == DT_RUNPATH:
+                self.runpath.extend(string(value).split(":"))
+
+
+def in_root(root, path):
+    """
+    Resolves `path` (absolute, inside the image) to a path on this host,
+    following symlinks the way they resolve inside the image: an absolute
+    link target starts over at `root`, not at the host's /.
+
+    Returns:
+        str: The host path, or None if it does not exist.
+    """
+    parts = [p for p in path.split("/") if p]
+    resolved = []
+    hops = 0
+    while parts:
+        part = parts.pop(0)
+        if part == ".":
+            continue
+        if part == "..":
+            resolved = resolved[:-1]
+            continue
+        host = os.path.join(root, *resolved, part)
+        if os.path.islink(host):
+            hops += 1
+            if hops > 40:
+                return None
+            target = os.readlink(host)
+            if target.startswith("/"):
+                resolved = []
+            parts = [p for p in target.split("/") if p] + parts
+            continue
+        if not os.path.lexists(host):
+            return None
+        resolved.append(part)
+    return os.path.join(root, *resolved)
+
+
+def ld_so_conf(root, conf="/etc/ld.so.conf", seen=None):
+    """
+    Returns the library directories listed in the image's ld.so.conf,
+    following its `include` lines.
+    """
+    seen = seen if seen is not None else set()
+    host = in_root(root, conf)
+    if host is None or conf in seen:
+        return []
+    seen.add(conf)
+    directories = []
+    with open(host, "r", encoding="utf-8", errors="replace") as infile:
+        for line in infile:
+            line = line.split("#", 1)[0].strip()
+            if not line or line.startswith("hwcap "):
+                continue
+            if line.startswith("include "):
+                for pattern in line.split()[1:]:
+                    if not pattern.startswith("/"):
+                        pattern = os.path.join(os.path.dirname(conf), pattern)
+                    for match in sorted(glob.glob(root + pattern)):
+                        directories += ld_so_conf(root, match[len(root):], seen)
+                continue
+            directories += [d for d in line.replace(",", " ").replace(":", " ").split() if d]
+    return directories
+
+
+class Resolver:
+    """
+    Computes the closure of a list of binaries inside one image.
+
+    Methods
+    -------
+    closure(binaries):
+        Returns every file the binaries need at runtime, themselves included.
+    """
+
+    def __init__(self, root):
+        self.root = root.rstrip("/") or "/"
+        self.conf_dirs = ld_so_conf(self.root)
+        self.elves = {}
+        self.unresolved = []
+
+    def elf(self, path):
+        """
+        Returns the parsed ELF at `path` inside the image, None if it is not
+        one (a script, say).
+        """
+        if path not in self.elves:
+            host = in_root(self.root, path)
+            try:
+                self.elves[path] = Elf(host) if host else None
+            except (ValueError, OSError, struct.error):
+                self.elves[path] = None
+        return self.elves[path]
+
+    def search_dirs(self, path, elf):
+        origin = os.path.dirname(path)
+        defaults = ["/lib64", "/usr/lib64"] if elf.elf_class == 2 else []
+        dirs = ([] if elf.runpath else elf.rpath) + elf.runpath + self.conf_dirs + defaults + ["/lib", "/usr/lib"]
+        return [d.replace("$ORIGIN", origin).replace("${ORIGIN}", origin) for d in dirs if d]
+
+    def find(self, name, path, elf):
+        if "/" in name:
+            return name if in_root(self.root, name) else None
+        for directory in self.search_dirs(path, elf):
+            candidate = os.path.normpath(os.path.join(directory, name))
+            lib = self.elf(candidate)
+            # Like the loader, skip libraries built for another ABI.
+            if lib is not None and lib.elf_class == elf.elf_class and lib.machine == elf.machine:
+                return candidate
+        return None
+
+    def closure(self, binaries):
+        files, queue = [], []
+        for binary in binaries:
+            if in_root(self.root, binary) and binary not in files:
+                files.append(binary)
+                queue.append(binary)
+        while queue:
+            path = queue.pop(0)
+            elf = self.elf(path)
+            if elf is None:
+                continue
+            needed = [(name, self.find(name, path, elf)) for name in elf.needed]
+            if elf.interp:
+                needed.append((elf.interp, elf.interp if in_root(self.root, elf.interp) else None))
+            for name, found in needed:
+                if found is None:
+                    self.unresolved.append(f"{path}: {name}")
+                elif found not in files:
+                    files.append(found)
+                    queue.append(found)
+        return files
+
+
+def copy_file(root, dest, path):
+    """
+    Copies one file from the image to the same path under `dest`,
+    dereferenced, keeping mode, owner and times.
+
+    Returns:
+        bool: Whether it was copied (False if it was there already).
+    """
+    target = dest.rstrip("/") + path
+    if os.path.lexists(target):
+        return False
+    source = in_root(root, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.copy2(source, target)
+    stat = os.stat(source)
+    os.chown(target, stat.st_uid, stat.st_gid)
+    return True
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            root=dict(type="path", required=True),
+            binaries=dict(type="list", elements="str", required=True),
+            dest=dict(type="path", required=True),
+            threads=dict(type="int", default=8),
+        ),
+    )
+    params = module.params
+    started = time.monotonic()
+    resolver = Resolver(params["root"])
+    # /lib/x and /usr/lib/x are one file once /lib is a symlink, in the
+    # image and in dest alike: copy each only once, or two threads could
+    # write the same file at the same time.
+    files = list({os.path.join(in_root(resolver.root, os.path.dirname(path)), os.path.basename(path)): path
+                  for path in reversed(resolver.closure(params["binaries"]))}.values())[::-1]
+    with ThreadPoolExecutor(max_workers=params["threads"]) as pool:
+        copied = [path for path, done in zip(files, pool.map(
+            lambda path: copy_file(resolver.root, params["dest"], path), files)) if done]
+    for unresolved in resolver.unresolved:
+        module.warn(f"not found: {unresolved}")
+    module.exit_json(changed=bool(copied), copied=copied, unresolved=resolver.unresolved,
+                     seconds=round(time.monotonic() - started, 3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/python3
+# Used by prepare.yaml to read the whole state of the disk images in one
+# round-trip, instead of a stat, an nbd size check and blkid calls of
+# their own, so every task after it only runs where the state differs
+# from what it would set up.
+import grp
+import os
+import pwd
+import stat
+
+from ansible.module_utils.basic import AnsibleModule
+
+DOCUMENTATION = r"""
+module: image_state
+short_description: Probe the disk images, their nbd attachment, filesystems and mounts
+description:
+  - Reports, as the C(image_state) fact, which image files exist, whether
+    I(nbd_device) is attached and which of its partitions the kernel knows
+    and has a current device node for, the filesystem type on each of
+    I(filesystems), what is mounted at each of I(mounts), and the type,
+    owner, group and mode of each of I(paths).
+  - Never changes anything. Run it again (module_defaults keeps the
+    arguments) after tasks that attach, partition or mount, so the tasks
+    after those see the new state.
+options:
+  images:
+    type: list
+    elements: path
+    default: []
+  nbd_device:
+    description: The qemu-nbd device of the root image, empty if not used.
+    type: str
+    default: ""
+  partitions:
+    description: Partition suffixes of I(nbd_device).
+    type: list
+    elements: str
+    default: [p1, p2]
+  filesystems:
+    description: Image files or block devices to read the filesystem type of.
+    type: list
+    elements: path
+    default: []
+  mounts:
+    type: list
+    elements: path
+    default: []
+  paths:
+    type: list
+    elements: path
+    default: []
+"""
+
+RETURN = r"""
+image_state:
+  description: Returned as a fact.
+  type: dict
+  contains:
+    images:
+      description: Image path to whether it exists.
+      type: dict
+    nbd:
+      description: >-
+        C(attached), C(partitions) the kernel knows, and C(stale_nodes), the
+        known partitions whose device node is missing or points at another
+        device (they change on every reconnect, and no udev recreates them).
+      type: dict
+    filesystems:
+      description: Path to filesystem type, empty for none or unreadable.
+      type: dict
+    mounts:
+      description: Mount point to the source mounted there, empty if none.
+      type: dict
+    paths:
+      description: >-
+        Path to C(type) (directory, link, file, other or absent), C(owner),
+        C(group), C(mode) and, for links, C(target).
+      type: dict
+"""
+
+
+def read(path):
+    try:
+        with open(path, "r", encoding="utf-8") as infile:
+            return infile.read().strip()
+    except OSError:
+        return None
+
+
+def nbd_state(device, partitions):
+    name = os.path.basename(device)
+    attached = read(f"/sys/class/block/{name}/size") not in (None, "0")
+    known, stale = [], []
+    for part in partitions if attached else []:
+        numbers = read(f"/sys/class/block/{name}/{name}{part}/dev")
+        if numbers is None:
+            continue
+        known.append(part)
+        try:
+            node = os.stat(device + part)
+        except OSError:
+            stale.append(part)
+            continue
+        if not stat.S_ISBLK(node.st_mode) or f"{os.major(node.st_rdev)}:{os.minor(node.st_rdev)}" != numbers:
+            stale.append(part)
+    return dict(attached=attached, partitions=known, stale_nodes=stale)
+
+
+def filesystem_types(module, paths):
+    """
+    One blkid call for every path. blkid prints nothing for a path without
+    a filesystem (and exits 2 if none had one).
+    """
+    types = dict.fromkeys(paths, "")
+    if not paths:
+        return types
+    _, out, _ = module.run_command([module.get_bin_path("blkid", required=True), "-o", "export"] + paths)
+    device = None
+    for line in out.splitlines():
+        key, _, value = line.partition("=")
+        if key == "DEVNAME":
+            device = value
+        elif key == "TYPE" and device in types:
+            types[device] = value
+    return types
+
+
+def mounted_sources(mount_points):
+    """
+    What is mounted at each of mount_points, from /proc/self/mountinfo
+    (the last mount at a path is the one in use).
+    """
+    sources = {os.path.normpath(path): "" for path in mount_points}
+    with open("/proc/self/mountinfo", "r", encoding="utf-8") as infile:
+        for line in infile:
+            fields, _, rest = line.partition(" - ")
+            target = fields.split()[4].encode().decode("unicode_escape")
+            if target in sources:
+                sources[target] = rest.split()[1]
+    return {path: sources[os.path.normpath(path)] for path in mount_points}
+
+
+def path_state(path):
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return dict(type="absent")
+    if stat.S_ISDIR(info.st_mode):
+        kind = "directory"
+    elif stat.S_ISLNK(info.st_mode):
+        kind = "link"
+    elif stat.S_ISREG(info.st_mode):
+        kind = "file"
+    else:
+        kind = "other"
+    try:
+        owner = pwd.getpwuid(info.st_uid).pw_name
+    except KeyError:
+        owner = str(info.st_uid)
+    try:
+        group = grp.getgrgid(info.st_gid).gr_name
+    except KeyError:
+        group = str(info.st_gid)
+    state = dict(type=kind, owner=owner, group=group, mode=f"{stat.S_IMODE(info.st_mode):04o}")
+    if kind == "link":
+        state["target"] = os.readlink(path)
+    return state
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            images=dict(type="list", elements="path", default=[]),
+            nbd_device=dict(type="str", default=""),
+            partitions=dict(type="list", elements="str", default=["p1", "p2"]),
+            filesystems=dict(type="list", elements="path", default=[]),
+            mounts=dict(type="list", elements="path", default=[]),
+            paths=dict(type="list", elements="path", default=[]),
+        ),
+        supports_check_mode=True,
+    )
+    params = module.params
+
+    nbd = dict(attached=False, partitions=[], stale_nodes=[])
+    if params["nbd_device"]:
+        nbd = nbd_state(params["nbd_device"], params["partitions"])
+    # Only read a partition through a node that is current: a stale one
+    # may point at a partition of some other device, or at nothing.
+    unreadable = {params["nbd_device"] + part for part in params["partitions"]
+                  if part not in nbd["partitions"] or part in nbd["stale_nodes"]} if params["nbd_device"] else set()
+    readable = [path for path in params["filesystems"] if path not in unreadable and os.path.exists(path)]
+    filesystems = dict.fromkeys(params["filesystems"], "")
+    filesystems.update(filesystem_types(module, readable))
+
+    module.exit_json(changed=False, ansible_facts=dict(image_state=dict(
+        images={path: os.path.exists(path) for path in params["images"]},
+        nbd=nbd,
+        filesystems=filesystems,
+        mounts=mounted_sources(params["mounts"]),
+        paths={path: path_state(path) for path in params["paths"]},
+    )))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/python3
+# Used by initramfs.yaml to pick the kernel modules of one hardware profile
+# (initramfs_modules in vars/automated-linux.yaml) instead of copying the
+# whole allmodconfig modules tree.
+import fnmatch
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ansible.module_utils.basic import AnsibleModule
+
+DOCUMENTATION = r"""
+module: kmod_closure
+short_description: Copy the kernel modules a hardware profile needs, with their dependencies
+description:
+  - Resolves module names and device modaliases against the C(modules.alias)
+    of C(<root>/lib/modules/<release>), then follows C(modules.dep) and the
+    pre/post soft dependencies of C(modules.softdep) to the full closure.
+  - Copies the closure to the same paths under C(<dest>/lib/modules/<release>)
+    and regenerates its C(modules.*) indexes with C(depmod -b <dest>), so
+    C(modprobe) inside I(dest) only knows the modules that are there.
+options:
+  root:
+    type: path
+    required: true
+  release:
+    type: str
+    required: true
+  dest:
+    type: path
+    required: true
+  modules:
+    description: Module names or aliases (C(fs-ext4), C(usb-storage), ...).
+    type: list
+    elements: str
+    default: []
+  modaliases:
+    description: Device modaliases, as read from C(/sys/bus/*/devices/*/modalias).
+    type: list
+    elements: str
+    default: []
+  modalias_files:
+    description: Files of modaliases, one per line, captured on a target machine.
+    type: list
+    elements: path
+    default: []
+  all:
+    description: Copy every module instead.
+    type: bool
+    default: false
+  threads:
+    description: Parallel copies.
+    type: int
+    default: 8
+"""
+
+RETURN = r"""
+copied:
+  description: Module names copied.
+  type: list
+builtin:
+  description: Requested modules that are built into the kernel.
+  type: list
+unresolved:
+  description: Requested names and modaliases no module matched.
+  type: list
+bytes:
+  description: Size of the copied modules.
+  type: int
+total_bytes:
+  description: Size of every module of the release.
+  type: int
+seconds:
+  type: float
+"""
+
+MODULE_SUFFIXES = (".ko", ".ko.gz", ".ko.xz", ".ko.zst")
+# Copied along so depmod can rebuild the builtin indexes too.
+INDEX_INPUTS = ("modules.order", "modules.builtin", "modules.builtin.modinfo")
+
+
+def module_name(path):
+    """
+    Returns the name modprobe knows a module file by: kernel/fs/fat/vfat.ko.xz
+    is vfat, and dashes and underscores are the same thing.
+    """
+    name = os.path.basename(path)
+    for suffix in MODULE_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return name.replace("-", "_")
+
+
+def read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8", errors="replace") as infile:
+        return [line.strip() for line in infile if line.strip() and not line.startswith("#")]
+
+
+class ModuleIndex:
+    """
+    The modules.dep/modules.alias/modules.softdep view of one release's
+    modules directory.
+
+    Methods
+    -------
+    resolve(name):
+        Returns the modules a name or alias stands for.
+    match(modalias):
+        Returns the modules whose alias patterns match a device modalias.
+    closure(names):
+        Returns the names plus everything they depend on.
+    """
+
+    def __init__(self, directory):
+        self.files, self.deps, self.softdeps = {}, {}, {}
+        for line in read_lines(os.path.join(directory, "modules.dep")):
+            path, _, deps = line.partition(":")
+            self.files[module_name(path)] = path
+            self.deps[module_name(path)] = [module_name(dep) for dep in deps.split()]
+        for line in read_lines(os.path.join(directory, "modules.softdep")):
+            # softdep <module> pre: <modules> post: <modules>
+            fields = line.split()
+            if fields[0] == "softdep" and len(fields) > 2:
+                self.softdeps.setdefault(module_name(fields[1]), []).extend(
+                    module_name(dep) for dep in fields[2:] if not dep.endswith(":"))
+        for line in read_lines(os.path.join(directory, "modules.weakdep")):
+            fields = line.split()
+            if fields[0] == "weakdep" and len(fields) > 2:
+                self.softdeps.setdefault(module_name(fields[1]), []).extend(
+                    module_name(dep) for dep in fields[2:])
+        self.builtin = {module_name(path) for path in read_lines(os.path.join(directory, "modules.builtin"))}
+        # Alias patterns by bus (the part before the first ':'), so a
+        # modalias is only matched against the patterns of its own bus.
+        self.aliases = {}
+        for line in read_lines(os.path.join(directory, "modules.alias")):
+            fields = line.split()
+            if len(fields) == 3 and fields[0] == "alias":
+                self.aliases.setdefault(fields[1].split(":", 1)[0], []).append((fields[1], module_name(fields[2])))
+
+    def match(self, modalias):
+        return sorted({module for pattern, module in self.aliases.get(modalias.split(":", 1)[0], [])
+                       if fnmatch.fnmatchcase(modalias, pattern)})
+
+    def resolve(self, name):
+        if module_name(name) in self.files or module_name(name) in self.builtin:
+            return [module_name(name)]
+        # Aliases normalize dashes to underscores as well.
+        return self.match(name) or self.match(name.replace("-", "_"))
+
+    def closure(self, names):
+        seen, queue = [], list(names)
+        while queue:
+            name = queue.pop(0)
+            if name in seen or name not in self.files:
+                continue
+            seen.append(name)
+            queue += self.deps.get(name, []) + self.softdeps.get(name, [])
+        return seen
+
+
+def copy_module(source, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.copy2(source, target)
+    return os.path.getsize(target)
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            root=dict(type="path", required=True),
+            release=dict(type="str", required=True),
+            dest=dict(type="path", required=True),
+            modules=dict(type="list", elements="str", default=[]),
+            modaliases=dict(type="list", elements="str", default=[]),
+            modalias_files=dict(type="list", elements="path", default=[]),
+            all=dict(type="bool", default=False),
+            threads=dict(type="int", default=8),
+        ),
+    )
+    params = module.params
+    started = time.monotonic()
+    source_dir = os.path.join(params["root"], "lib/modules", params["release"])
+    dest_dir = os.path.join(params["dest"], "lib/modules", params["release"])
+    if not os.path.isfile(os.path.join(source_dir, "modules.dep")):
+        module.fail_json(msg=f"{source_dir}/modules.dep not found; run depmod for {params['release']} first")
+    index = ModuleIndex(source_dir)
+
+    wanted, builtin, unresolved = [], [], []
+    modaliases = list(params["modaliases"])
+    for path in params["modalias_files"]:
+        modaliases += read_lines(path)
+    requests = [(name, index.resolve(name)) for name in params["modules"]] + \
+        [(modalias, index.match(modalias)) for modalias in modaliases]
+    for request, names in requests:
+        # A modalias nothing claims is normal (a bridge, a CPU core, ...);
+        # only a module asked for by name has to exist.
+        if not names and request in params["modules"]:
+            unresolved.append(request)
+        for name in names:
+            if name in index.builtin:
+                builtin.append(name)
+            elif name not in wanted:
+                wanted.append(name)
+    names = sorted(index.files) if params["all"] else index.closure(wanted)
+
+    with ThreadPoolExecutor(max_workers=params["threads"]) as pool:
+        sizes = list(pool.map(lambda name: copy_module(os.path.join(source_dir, index.files[name]),
+                                                       os.path.join(dest_dir, index.files[name])), names))
+    for name in INDEX_INPUTS:
+        if os.path.exists(os.path.join(source_dir, name)):
+            os.makedirs(dest_dir, exist_ok=True)
+            shutil.copy2(os.path.join(source_dir, name), os.path.join(dest_dir, name))
+    module.run_command([module.get_bin_path("depmod", required=True), "-b", params["dest"], params["release"]],
+                       check_rc=True)
+
+    for name in unresolved:
+        module.warn(f"no module for {name}")
+    total_bytes = sum(os.path.getsize(os.path.join(source_dir, path)) for path in index.files.values())
+    module.exit_json(changed=True, copied=names, builtin=sorted(set(builtin)), unresolved=unresolved,
+                     bytes=sum(sizes), total_bytes=total_bytes, seconds=round(time.monotonic() - started, 3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/python3
+# Runs a whole package recipe (download, extract, the recipe's own phases,
+# cleanup) in a single module invocation, i.e. one connection round-trip
+# instead of one per task. See the "Recipe executor" section of the README.
+import hashlib
+import os
+import shlex
+import shutil
+import subprocess
+import time
+from datetime import datetime
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.build_tmpfs import (fits_tmpfs, load_footprint, mount_tmpfs, record_build,
+                                              save_footprint, tmpfs_full, tmpfs_usage, tree_size)
+from ansible.module_utils.source_extract import extract
+from ansible.module_utils.urls import open_url
+
+DOCUMENTATION = r"""
+module: package_recipe
+short_description: Download, extract, build and clean up one source package in one go
+description:
+  - Makes sure the source tarball is in I(sources_dir) (verifying
+    I(checksum), downloading only if it is missing or does not match),
+    extracts it (see the source_extract module) unless
+    I(sources_dir)/I(version) already exists, runs every
+    phase script in order with bash and finally removes the extracted tree.
+  - Phases run inside I(chroot) if it is set, on the host otherwise, as
+    whichever user the task becomes.
+  - Every phase's output, exit code and timing come back in C(phases), so
+    run.py's timeline and log store can still tell configure from make from
+    install.
+  - With I(tmpfs_size), the package is extracted and built on a tmpfs
+    mounted at I(sources_dir)/I(version), unless its peak footprint recorded
+    in I(footprints) is larger. A build that fills the tmpfs is recorded as
+    too large and started over on disk.
+options:
+  name:
+    description: Package name, used in messages.
+    type: str
+    required: true
+  url:
+    description: Source tarball; stored as I(sources_dir)/<basename of the URL>.
+    type: str
+    required: true
+  checksum:
+    description: C(sha256:<digest>), as get_url takes it (see prefetch.yaml's C(source_checksums)).
+    type: str
+  version:
+    description: Directory the tarball extracts to, relative to I(sources_dir).
+    type: str
+    required: true
+  sources_dir:
+    type: path
+    required: true
+  chroot:
+    description: Root directory to run the phases in.
+    type: path
+  chdir:
+    description: Directory the phases start in (inside I(chroot), if set).
+    type: str
+  phases:
+    description:
+      - List of C(name)/C(script) dicts. A phase named C(extract) replaces the
+        default C(tar xf) extraction.
+    type: list
+    elements: dict
+    required: true
+  cleanup:
+    description: Remove I(sources_dir)/I(version) once every phase succeeded.
+    type: bool
+    default: true
+  retries:
+    type: int
+    default: 5
+  delay:
+    type: int
+    default: 10
+  tmpfs_size:
+    description: Size in bytes of the tmpfs to build on; 0 builds on disk.
+    type: int
+    default: 0
+  extract_cache:
+    description: The extracted tree cache of source_extract; no caching if unset.
+    type: path
+  footprints:
+    description:
+      - Directory of C(<name>.json) records of each package's peak build
+        footprint and its build time on tmpfs and on disk.
+    type: path
+  disk_baseline:
+    description: Build on disk if I(footprints) has no disk build time for the package yet.
+    type: bool
+    default: false
+"""
+
+RETURN = r"""
+phases:
+  description: One entry per phase that ran (download, extract, the recipe's, cleanup).
+  type: list
+  elements: dict
+  contains:
+    name: {type: str}
+    rc: {type: int}
+    start: {type: str, description: ISO-8601 start time}
+    seconds: {type: float}
+    stdout: {type: str}
+    stderr: {type: str}
+build_dir:
+  description: C(tmpfs) or C(disk).
+  type: str
+footprint:
+  description: Peak size in bytes of the extracted and built tree.
+  type: int
+"""
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def now():
+    return datetime.now().isoformat()
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as infile:
+        for chunk in iter(lambda: infile.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def download(params, path, expected):
+    """
+    Fetches the tarball unless a copy matching the checksum is already there
+    (prefetch.yaml normally put it in place).
+
+    Returns:
+        str: What was done, for the phase's stdout.
+    """
+    if os.path.exists(path) and (expected is None or sha256_file(path) == expected):
+        return f"{os.path.basename(path)} already present"
+
+    error = None
+    for attempt in range(params["retries"] + 1):
+        if attempt:
+            time.sleep(params["delay"])
+        tmp = f"{path}.part"
+        digest = hashlib.sha256()
+        try:
+            response = open_url(params["url"])
+            with open(tmp, "wb") as outfile:
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    outfile.write(chunk)
+        except Exception as exc:  # urllib, socket and OS errors all retry
+            error = f"{params['url']}: {exc}"
+            continue
+        if expected is not None and digest.hexdigest() != expected:
+            os.unlink(tmp)
+            error = f"{params['url']}: sha256 {digest.hexdigest()} does not match {expected}"
+            continue
+        # A symlink into the (read-only) source store is replaced, not
+        # written through.
+        os.replace(tmp, path)
+        return f"downloaded {params['url']}"
+    raise RuntimeError(error)
+
+
+def run_script(params, script):
+    if params["chdir"]:
+        script = f"cd {shlex.quote(params['chdir'])}\n{script}"
+    command = ["/bin/bash", "-e", "-c", script]
+    if params["chroot"]:
+        command = ["chroot", params["chroot"]] + command
+    return subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True,
+                          text=True, errors="replace", check=False)
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            name=dict(type="str", required=True),
+            url=dict(type="str", required=True),
+            checksum=dict(type="str"),
+            version=dict(type="str", required=True),
+            sources_dir=dict(type="path", required=True),
+            chroot=dict(type="path"),
+            chdir=dict(type="str"),
+            phases=dict(type="list", elements="dict", required=True),
+            cleanup=dict(type="bool", default=True),
+            retries=dict(type="int", default=5),
+            delay=dict(type="int", default=10),
+            tmpfs_size=dict(type="int", default=0),
+            extract_cache=dict(type="path"),
+            footprints=dict(type="path"),
+            disk_baseline=dict(type="bool", default=False),
+        ),
+    )
+    params = module.params
+    tarball = os.path.join(params["sources_dir"], os.path.basename(params["url"]))
+    source_tree = os.path.join(params["sources_dir"], params["version"])
+    expected = params["checksum"].split(":", 1)[1].lower() if params["checksum"] else None
+
+    phases = []
+    footprint = load_footprint(params["footprints"], params["name"])
+
+    class TmpfsFull(Exception):
+        pass
+
+    def finish(name, started, rc=0, stdout="", stderr=""):
+        phases.append(dict(name=name, rc=rc, start=started[0],
+                           seconds=round(time.monotonic() - started[1], 3),
+                           stdout=stdout, stderr=stderr))
+        if rc != 0 and on_tmpfs and tmpfs_full(source_tree):
+            raise TmpfsFull()
+        if rc != 0:
+            module.fail_json(msg=f"{params['name']}: {name} failed (rc {rc})", rc=rc,
+                             failed_phase=name, stdout=stdout, stderr=stderr, phases=phases,
+                             build_dir="tmpfs" if on_tmpfs else "disk", changed=True)
+
+    def build():
+        """
+        Extracts and builds the package, returning its peak footprint.
+        """
+        peak = 0
+        if on_tmpfs and not os.path.ismount(source_tree):
+            mount_tmpfs(source_tree, params["tmpfs_size"])
+        if not any(p["name"] == "extract" for p in recipe_phases):
+            started = (now(), time.monotonic())
+            if os.path.isdir(source_tree) and (not on_tmpfs or os.listdir(source_tree)):
+                finish("extract", started, stdout=f"{params['version']} already extracted")
+            else:
+                result = extract(tarball, params["sources_dir"], cache=params["extract_cache"])
+                finish("extract", started, result["rc"], f"{result['how']} {os.path.basename(tarball)}",
+                       result["stderr"])
+
+        for phase in recipe_phases:
+            started = (now(), time.monotonic())
+            result = run_script(params, phase["script"])
+            finish(phase["name"], started, result.returncode, result.stdout, result.stderr)
+            # Free space on a tmpfs is cheap to check after every phase;
+            # walking the tree on disk is not, so that is done once at the
+            # end (by then most builds are at their largest).
+            if on_tmpfs:
+                peak = max(peak, tmpfs_usage(source_tree)[0])
+        if not on_tmpfs and params["footprints"] and os.path.isdir(source_tree):
+            peak = tree_size(source_tree)
+        return peak
+
+    def remove_tree():
+        if os.path.ismount(source_tree):
+            subprocess.run(["umount", source_tree], check=True)
+            os.rmdir(source_tree)
+        elif os.path.lexists(source_tree):
+            shutil.rmtree(source_tree)
+
+    started = (now(), time.monotonic())
+    on_tmpfs = False
+    try:
+        finish("download", started, stdout=download(params, tarball, expected))
+    except Exception as exc:
+        finish("download", started, rc=1, stderr=str(exc))
+
+    recipe_phases = [dict(name=p["name"], script=p["script"]) for p in params["phases"]]
+    # A tree left over from an interrupted run is built where it is.
+    on_tmpfs = os.path.ismount(source_tree) or (
+        params["tmpfs_size"] > 0 and not os.path.lexists(source_tree)
+        and fits_tmpfs(footprint, params["tmpfs_size"], params["disk_baseline"]))
+    build_started = len(phases)
+    try:
+        peak = build()
+    except TmpfsFull:
+        # Too large for the tmpfs: remember that and start over on disk.
+        footprint["peak_bytes"] = params["tmpfs_size"] + 1
+        remove_tree()
+        on_tmpfs = False
+        build_started = len(phases)
+        peak = build()
+
+    if params["cleanup"]:
+        started = (now(), time.monotonic())
+        try:
+            remove_tree()
+            finish("cleanup", started)
+        except (OSError, subprocess.CalledProcessError) as exc:
+            finish("cleanup", started, rc=1, stderr=str(exc))
+
+    build_dir = "tmpfs" if on_tmpfs else "disk"
+    if params["footprints"]:
+        record_build(footprint, build_dir, peak, sum(p["seconds"] for p in phases[build_started:]),
+                     params["tmpfs_size"])
+        save_footprint(params["footprints"], params["name"], footprint)
+
+    module.exit_json(changed=True, phases=phases, build_dir=build_dir, footprint=peak,
+                     msg=", ".join(f"{p['name']} {p['seconds']:.0f}s" for p in phases) + f" ({build_dir})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+# Used by the multi-step recipes and kernel.yaml in place of unarchive /
+# `tar xf`; package_recipe extracts through the same helper. See the
+# "Source extraction" section of the README.
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.source_extract import extract
+
+DOCUMENTATION = r"""
+module: source_extract
+short_description: Extract a source tarball with a multi-threaded decoder, or from the extracted tree cache
+description:
+  - Decompresses I(src) with the fastest installed decoder for its format
+    (C(xz -T0), C(zstd -T0), C(pigz), C(lbzip2)/C(pbzip2), falling back to
+    the single-threaded ones) and untars the stream straight into I(dest).
+  - With I(cache), the extracted tree is also kept in C(<cache>/<sha256>)
+    and later extractions of the same tarball copy it from there instead.
+options:
+  src:
+    type: path
+    required: true
+  dest:
+    type: path
+    required: true
+  creates:
+    description: Do nothing if this path exists, unless it is an empty directory.
+    type: path
+  cache:
+    description: The extracted tree cache; no caching if unset.
+    type: path
+  threads:
+    description: Decoder threads, 0 for one per CPU.
+    type: int
+    default: 0
+"""
+
+RETURN = r"""
+how:
+  description: C(skipped), C(cached) or C(extracted).
+  type: str
+seconds:
+  type: float
+"""
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            src=dict(type="path", required=True),
+            dest=dict(type="path", required=True),
+            creates=dict(type="path"),
+            cache=dict(type="path"),
+            threads=dict(type="int", default=0),
+        ),
+    )
+    params = module.params
+    started = time.monotonic()
+    result = extract(params["src"], params["dest"], creates=params["creates"],
+                     cache=params["cache"], threads=params["threads"])
+    result["seconds"] = round(time.monotonic() - started, 3)
+    if result["rc"] != 0:
+        module.fail_json(msg=f"extracting {params['src']} failed (rc {result['rc']})", **result)
+    module.exit_json(**result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+#!/usr/bin/python3
+# Used by prefetch.yaml; see there and the "Source prefetch" section of the
+# README.
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.urls import open_url
+
+DOCUMENTATION = r"""
+module: source_prefetch
+short_description: Download source tarballs concurrently into a content-addressed store
+description:
+  - Downloads every URL into the store I(dest), at most I(max_connections)
+    at a time and at most I(connections_per_host) per server. Each file is
+    kept as C(sha256/<digest>), so one copy serves every image and name.
+  - Each file is checked against the sha256 I(manifest). Files the manifest
+    does not know yet are recorded in it (if I(record)), a mismatch fails.
+  - Every file name gets a symlink in I(publish), where the recipes look for
+    their tarballs, pointing at C(<link_dir>/<digest>).
+options:
+  urls:
+    description: Source URLs the recipes need. A failed download fails the module.
+    type: list
+    elements: str
+    required: true
+  url_lists:
+    description:
+      - Files with one URL per line (e.g. packages.txt). URLs whose file name
+        is not in I(urls) are fetched as well, but a failure only warns.
+    type: list
+    elements: path
+    default: []
+  dest:
+    description: The store directory.
+    type: path
+    required: true
+  publish:
+    description: Directory the file name symlinks are created in, skipped if unset.
+    type: path
+  link_dir:
+    description:
+      - Where the store's C(sha256) directory is mounted, relative to
+        I(publish). The symlinks are relative, so they resolve both in
+        I(publish) and wherever it is seen from inside a chroot.
+    type: str
+    default: .source-store
+  gc:
+    description: Delete stored files that none of the URLs (or I(url_lists)) refer to any more.
+    type: bool
+    default: false
+  manifest:
+    description: sha256sum-style manifest (C(<sha256>  <file name>) per line).
+    type: path
+    required: true
+  record:
+    description: Add files missing from the manifest to it instead of failing.
+    type: bool
+    default: true
+  upstream:
+    description:
+      - Fetch every file from C(<upstream>/<file name>) instead of its own URL,
+        e.g. a local C(python3 -m http.server) standing in for the mirrors.
+    type: str
+  connections_per_host:
+    type: int
+    default: 2
+  max_connections:
+    type: int
+    default: 8
+  retries:
+    type: int
+    default: 5
+  delay:
+    description: Seconds between retries of one file.
+    type: int
+    default: 10
+  timeout:
+    type: int
+    default: 60
+"""
+
+RETURN = r"""
+checksums:
+  description: File name -> C(sha256:<digest>) of every file in the store, in get_url's checksum format.
+  type: dict
+downloaded:
+  description: Files fetched during this run.
+  type: list
+recorded:
+  description: Files newly added to the manifest.
+  type: list
+published:
+  description: File name symlinks created or repointed in I(publish).
+  type: list
+removed:
+  description: Digests deleted from the store by I(gc).
+  type: list
+bytes_downloaded:
+  type: int
+seconds:
+  description: Wall time of the whole prefetch.
+  type: float
+"""
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def load_manifest(path):
+    """
+    Reads a sha256sum-style manifest, skipping blank and # lines.
+
+    Returns:
+        tuple[list[str], dict]: The comment header, and file name -> digest.
+    """
+    header, checksums = [], {}
+    if not os.path.exists(path):
+        return header, checksums
+    with open(path, "r", encoding="utf-8") as infile:
+        for line in infile:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                if not checksums:
+                    header.append(line)
+                continue
+            digest, name = line.split(None, 1)
+            checksums[name.lstrip("*")] = digest.lower()
+    return header, checksums
+
+
+def save_manifest(path, header, checksums):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as outfile:
+        for line in header:
+            outfile.write(line + "\n")
+        for name in sorted(checksums):
+            outfile.write(f"{checksums[name]}  {name}\n")
+    os.replace(tmp, path)
+
+
+class Prefetcher:
+    """
+    Fetches and verifies the files of one prefetch run.
+
+    Methods
+    -------
+    fetch(name, url):
+        Makes sure the store holds a verified copy of one file.
+    """
+
+    def __init__(self, params, checksums):
+        self.params = params
+        self.checksums = checksums
+        self.hosts = {}
+        self.lock = threading.Lock()
+        self.downloaded = []
+        self.unlisted = {}
+        self.recorded = []
+        self.bytes_downloaded = 0
+
+    def host_slot(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = threading.BoundedSemaphore(self.params["connections_per_host"])
+            return self.hosts[host]
+
+    def fetch(self, name, url):
+        """
+        Args:
+            name (str): File name the recipes know it by.
+            url (str): Where to download it from.
+
+        Returns:
+            str: The verified sha256 of the file.
+        """
+        expected = self.checksums.get(name)
+        # A stored file is only ever renamed into place under the digest it
+        # was verified to have, so finding it is enough.
+        if expected is not None and os.path.exists(object_path(self.params["dest"], expected)):
+            return expected
+
+        if self.params["upstream"]:
+            url = f"{self.params['upstream'].rstrip('/')}/{name}"
+        error = None
+        for attempt in range(self.params["retries"] + 1):
+            if attempt:
+                time.sleep(self.params["delay"])
+            tmp = os.path.join(self.params["dest"], "tmp", f"{name}.part")
+            try:
+                digest, size = self.download(url, tmp)
+            except Exception as exc:  # urllib, socket and OS errors all retry
+                error = f"{url}: {exc}"
+                continue
+            if expected is not None and digest != expected:
+                # Not a network error: downloading it again gets the same file.
+                os.unlink(tmp)
+                raise RuntimeError(f"{url}: sha256 {digest} does not match the manifest ({expected})")
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, object_path(self.params["dest"], digest))
+            with self.lock:
+                self.downloaded.append(name)
+                self.bytes_downloaded += size
+            return self.verified(name, digest)
+        raise RuntimeError(error)
+
+    def download(self, url, tmp):
+        digest = hashlib.sha256()
+        size = 0
+        with self.host_slot(url):
+            response = open_url(url, timeout=self.params["timeout"])
+            with open(tmp, "wb") as outfile:
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    outfile.write(chunk)
+                    size += len(chunk)
+        return digest.hexdigest(), size
+
+    def verified(self, name, digest):
+        """
+        Keeps the digest of a file the manifest does not list, and marks it
+        for the manifest only if `record` is set.
+        """
+        with self.lock:
+            if name not in self.checksums:
+                self.unlisted[name] = digest
+                if self.params["record"]:
+                    self.recorded.append(name)
+        return digest
+
+
+def object_path(store, digest):
+    return os.path.join(store, "sha256", digest)
+
+
+def publish(directory, name, digest, link_dir):
+    """
+    Points the file name the recipes use at its stored file. A regular file
+    in its place (downloaded by a recipe, or left over from before the
+    store) is replaced by the symlink.
+
+    Returns:
+        bool: Whether the symlink was created or changed.
+    """
+    target = os.path.join(directory, name)
+    link = os.path.join(link_dir, digest)
+    if os.path.islink(target) and os.readlink(target) == link:
+        return False
+    tmp = f"{target}.link"
+    if os.path.lexists(tmp):
+        os.unlink(tmp)
+    os.symlink(link, tmp)
+    os.replace(tmp, target)
+    return True
+
+
+def collect_garbage(store, publish_dir, referenced, link_dir):
+    """
+    Deletes stored files whose digest is not in `referenced`, and the
+    symlinks in `publish_dir` that pointed at them.
+
+    Returns:
+        list[str]: The deleted digests.
+    """
+    removed = []
+    for digest in sorted(os.listdir(os.path.join(store, "sha256"))):
+        if digest not in referenced:
+            os.unlink(object_path(store, digest))
+            removed.append(digest)
+    if publish_dir and removed:
+        prefix = link_dir.rstrip("/") + "/"
+        for name in os.listdir(publish_dir):
+            path = os.path.join(publish_dir, name)
+            if os.path.islink(path) and os.readlink(path).startswith(prefix) \
+                    and os.readlink(path)[len(prefix):] in removed:
+                os.unlink(path)
+    return removed
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            urls=dict(type="list", elements="str", required=True),
+            url_lists=dict(type="list", elements="path", default=[]),
+            dest=dict(type="path", required=True),
+            publish=dict(type="path"),
+            link_dir=dict(type="str", default=".source-store"),
+            gc=dict(type="bool", default=False),
+            manifest=dict(type="path", required=True),
+            record=dict(type="bool", default=True),
+            upstream=dict(type="str"),
+            connections_per_host=dict(type="int", default=2),
+            max_connections=dict(type="int", default=8),
+            retries=dict(type="int", default=5),
+            delay=dict(type="int", default=10),
+            timeout=dict(type="int", default=60),
+        ),
+    )
+    params = module.params
+    started = time.monotonic()
+
+    # Keyed by file name: the recipes find their tarball by the basename of
+    # their URL, so the first URL for a name wins and later ones (e.g. an
+    # outdated packages.txt line for the same file) are dropped.
+    sources = {}
+    for url in params["urls"]:
+        sources.setdefault(os.path.basename(urlsplit(url).path), url)
+    required = set(sources)
+    for url_list in params["url_lists"]:
+        with open(url_list, "r", encoding="utf-8") as infile:
+            for line in infile:
+                url = line.strip()
+                if url and not url.startswith("#"):
+                    sources.setdefault(os.path.basename(urlsplit(url).path), url)
+
+    header, checksums = load_manifest(params["manifest"])
+    if not params["record"]:
+        unknown = sorted(name for name in required if name not in checksums)
+        if unknown:
+            module.fail_json(msg=f"not in {params['manifest']}: {', '.join(unknown)}")
+
+    for subdir in ("sha256", "tmp"):
+        os.makedirs(os.path.join(params["dest"], subdir), exist_ok=True)
+    prefetcher = Prefetcher(params, checksums)
+    failed, warnings = {}, []
+    with ThreadPoolExecutor(max_workers=params["max_connections"]) as pool:
+        futures = {name: pool.submit(prefetcher.fetch, name, url) for name, url in sources.items()}
+        for name, future in futures.items():
+            try:
+                future.result()
+            except Exception as exc:
+                if name in required:
+                    failed[name] = str(exc)
+                else:
+                    warnings.append(f"{name} (only in {', '.join(params['url_lists'])}): {exc}")
+    for warning in warnings:
+        module.warn(warning)
+
+    if prefetcher.recorded:
+        save_manifest(params["manifest"], header,
+                      dict(checksums, **{name: prefetcher.unlisted[name] for name in prefetcher.recorded}))
+    # The files fetched this run that the manifest does not list still get
+    # published and kept, recorded or not.
+    checksums.update(prefetcher.unlisted)
+
+    published, removed = [], []
+    if not failed:
+        if params["publish"]:
+            for name in sorted(sources):
+                if name in checksums and os.path.exists(object_path(params["dest"], checksums[name])):
+                    if publish(params["publish"], name, checksums[name], params["link_dir"]):
+                        published.append(name)
+        # Only once every required file is in: a version bump that failed
+        # to download must not also lose the version before it.
+        if params["gc"]:
+            referenced = {checksums[name] for name in sources if name in checksums}
+            removed = collect_garbage(params["dest"], params["publish"], referenced, params["link_dir"])
+
+    result = dict(
+        changed=bool(prefetcher.downloaded or prefetcher.recorded or published or removed),
+        checksums={name: f"sha256:{checksums[name]}" for name in sources
+                   if name in checksums and name not in failed},
+        downloaded=sorted(prefetcher.downloaded),
+        recorded=sorted(prefetcher.recorded),
+        published=published,
+        removed=removed,
+        bytes_downloaded=prefetcher.bytes_downloaded,
+        seconds=round(time.monotonic() - started, 1),
+    )
+    if failed:
+        module.fail_json(msg=f"{len(failed)} source(s) could not be fetched", failed_sources=failed, **result)
+    module.exit_json(**result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+# The tmpfs builds of package_recipe for the recipes that extract and build
+# in separate tasks (the multi-step recipes, the toolchain, the kernel
+# sources): mounted before the extraction, taken down in place of the
+# removal of the source trees. See the "tmpfs builds" section of the README.
+import os
+import pwd
+import shutil
+import subprocess
+import time
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.build_tmpfs import (fits_tmpfs, load_footprint, mount_tmpfs, record_build,
+                                              save_footprint, tmpfs_full, tmpfs_usage, tree_size)
+
+DOCUMENTATION = r"""
+module: source_tmpfs
+short_description: Put the source trees of one build on a tmpfs, and remove them again
+description:
+  - With I(state=mounted), mounts a tmpfs of I(size) bytes at
+    I(sources_dir)/.tmpfs/I(name) and bind-mounts a directory of it at
+    I(sources_dir)/<tree> for every one of I(trees), so the recipe's own
+    extract and build tasks run on it unchanged. The package builds on disk
+    instead if its peak footprint recorded in I(footprints) is larger than
+    I(size), and a tmpfs a failed build filled is taken down and the package
+    recorded as too large.
+  - With I(state=absent), records the peak footprint and the build time
+    since I(state=mounted) in I(footprints), then unmounts or removes the
+    trees.
+options:
+  name:
+    description: Name of the build, for the tmpfs and the footprint record.
+    type: str
+    required: true
+  sources_dir:
+    type: path
+    required: true
+  trees:
+    description: Directories the build extracts to, relative to I(sources_dir).
+    type: list
+    elements: str
+    required: true
+  state:
+    type: str
+    choices: [mounted, absent]
+    default: mounted
+  size:
+    description: Size in bytes of the tmpfs; 0 builds on disk.
+    type: int
+    default: 0
+  owner:
+    description: User to own the trees on the tmpfs, for builds that do not run as root.
+    type: str
+  footprints:
+    description: Directory of C(<name>.json) footprint records, as package_recipe keeps them.
+    type: path
+  disk_baseline:
+    description: Build on disk if I(footprints) has no disk build time for I(name) yet.
+    type: bool
+    default: false
+"""
+
+RETURN = r"""
+build_dir:
+  description: C(tmpfs) or C(disk).
+  type: str
+footprint:
+  description: With I(state=absent), peak size in bytes of the trees.
+  type: int
+"""
+
+
+def unmount_trees(params, root):
+    """
+    Takes down the bind mounts, the tmpfs and whatever trees are on disk.
+
+    Returns:
+        bool: Whether there was anything to remove.
+    """
+    changed = False
+    for tree in params["trees"]:
+        path = os.path.join(params["sources_dir"], tree)
+        if os.path.ismount(path):
+            subprocess.run(["umount", path], check=True)
+            os.rmdir(path)
+            changed = True
+        elif os.path.lexists(path):
+            shutil.rmtree(path)
+            changed = True
+    if os.path.ismount(root):
+        subprocess.run(["umount", root], check=True)
+        os.rmdir(root)
+        changed = True
+    return changed
+
+
+def mount(params, root, footprint):
+    """
+    Mounts the tmpfs and its trees if the build fits.
+
+    Returns:
+        str: Where the build runs, tmpfs or disk.
+    """
+    if os.path.ismount(root):
+        if not tmpfs_full(root):
+            # Left over from an interrupted run: built where it is.
+            return "tmpfs"
+        # The previous build failed filling it.
+        footprint["peak_bytes"] = params["size"] + 1
+        unmount_trees(params, root)
+    trees = [os.path.join(params["sources_dir"], tree) for tree in params["trees"]]
+    if any(os.path.lexists(tree) for tree in trees) or not fits_tmpfs(footprint, params["size"],
+                                                                      params["disk_baseline"]):
+        return "disk"
+
+    uid = gid = None
+    if params["owner"]:
+        user = pwd.getpwnam(params["owner"])
+        uid, gid = user.pw_uid, user.pw_gid
+    mount_tmpfs(root, params["size"], uid, gid)
+    for tree, target in zip(params["trees"], trees):
+        for path in (os.path.join(root, tree), target):
+            os.makedirs(path, exist_ok=True)
+            if uid is not None:
+                os.chown(path, uid, gid)
+        subprocess.run(["mount", "--bind", os.path.join(root, tree), target], check=True)
+    return "tmpfs"
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            name=dict(type="str", required=True),
+            sources_dir=dict(type="path", required=True),
+            trees=dict(type="list", elements="str", required=True),
+            state=dict(type="str", choices=["mounted", "absent"], default="mounted"),
+            size=dict(type="int", default=0),
+            owner=dict(type="str"),
+            footprints=dict(type="path"),
+            disk_baseline=dict(type="bool", default=False),
+        ),
+    )
+    params = module.params
+    root = os.path.join(params["sources_dir"], ".tmpfs", params["name"])
+    footprint = load_footprint(params["footprints"], params["name"])
+
+    if params["state"] == "mounted":
+        was_mounted = os.path.ismount(root)
+        try:
+            build_dir = mount(params, root, footprint)
+        except (OSError, subprocess.CalledProcessError) as exc:
+            unmount_trees(params, root)
+            module.fail_json(msg=f"{params['name']}: mounting the tmpfs failed: {exc}")
+        if params["footprints"]:
+            # Read back by state=absent for the build time.
+            footprint["building"] = dict(build_dir=build_dir, started=time.time())
+            save_footprint(params["footprints"], params["name"], footprint)
+        module.exit_json(changed=build_dir == "tmpfs" and not was_mounted, build_dir=build_dir,
+                         msg=f"{params['name']} builds on {build_dir}")
+
+    building = footprint.pop("building", None)
+    build_dir = "tmpfs" if os.path.ismount(root) else "disk"
+    peak = 0
+    if build_dir == "tmpfs":
+        peak = tmpfs_usage(root)[0]
+    elif params["footprints"]:
+        trees = [os.path.join(params["sources_dir"], tree) for tree in params["trees"]]
+        peak = sum(tree_size(tree) for tree in trees if os.path.isdir(tree))
+    try:
+        changed = unmount_trees(params, root)
+    except (OSError, subprocess.CalledProcessError) as exc:
+        module.fail_json(msg=f"{params['name']}: removing the source trees failed: {exc}")
+    if params["footprints"] and building:
+        record_build(footprint, build_dir, peak, time.time() - building["started"], params["size"])
+        save_footprint(params["footprints"], params["name"], footprint)
+    module.exit_json(changed=changed, build_dir=build_dir, footprint=peak)
+
+
+if __name__ == "__main__":
+    main()
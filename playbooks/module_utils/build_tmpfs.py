@@ -0,0 +1,86 @@
+# Build footprint records and tmpfs helpers shared by the package_recipe and
+# source_tmpfs modules. See the "tmpfs builds" section of the README.
+import json
+import os
+import subprocess
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def tree_size(path):
+    """
+    Returns the disk usage of a directory tree in bytes, like `du -sx`.
+    """
+    device = os.lstat(path).st_dev
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            stat = os.lstat(os.path.join(root, name))
+            if stat.st_dev == device:
+                total += stat.st_blocks * 512
+        dirs[:] = [d for d in dirs if os.lstat(os.path.join(root, d)).st_dev == device]
+    return total
+
+
+def tmpfs_usage(path):
+    """
+    Returns the used and the still available bytes of the filesystem at
+    `path`.
+    """
+    stat = os.statvfs(path)
+    return (stat.f_blocks - stat.f_bfree) * stat.f_frsize, stat.f_bavail * stat.f_frsize
+
+
+def tmpfs_full(path):
+    return tmpfs_usage(path)[1] < CHUNK_SIZE
+
+
+def mount_tmpfs(path, size, uid=None, gid=None):
+    options = f"size={size},mode=0755"
+    if uid is not None:
+        options += f",uid={uid},gid={gid}"
+    os.makedirs(path, exist_ok=True)
+    subprocess.run(["mount", "-t", "tmpfs", "-o", options, "tmpfs", path], check=True)
+
+
+def load_footprint(footprints, name):
+    if not footprints:
+        return {}
+    try:
+        with open(os.path.join(footprints, f"{name}.json"), "r", encoding="utf-8") as infile:
+            return json.load(infile)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_footprint(footprints, name, footprint):
+    os.makedirs(footprints, exist_ok=True)
+    path = os.path.join(footprints, f"{name}.json")
+    with open(f"{path}.tmp", "w", encoding="utf-8") as outfile:
+        json.dump(footprint, outfile, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def fits_tmpfs(footprint, size, disk_baseline=False):
+    """
+    Decides whether a package builds on a tmpfs of `size` bytes: it has to
+    be on at all, and the package's recorded peak has to fit. With
+    `disk_baseline`, a package with no disk build time yet builds on disk
+    once, so the speedup report has something to compare against.
+    """
+    if disk_baseline and "disk" not in footprint.get("seconds", {}):
+        return False
+    return size > 0 and footprint.get("peak_bytes", 0) <= size
+
+
+def record_build(footprint, build_dir, peak, seconds, size):
+    """
+    Updates a footprint record with a finished build and the tmpfs size it
+    had, if any. A tmpfs build measures its peak exactly; a disk build only
+    at the end, so that never lowers the peak already recorded.
+    """
+    if size:
+        footprint["tmpfs_bytes"] = size
+    if peak:
+        footprint["peak_bytes"] = max(peak, footprint.get("peak_bytes", 0)) if build_dir == "disk" else peak
+    footprint.setdefault("seconds", {})[build_dir] = round(seconds, 1)
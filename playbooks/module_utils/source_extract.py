@@ -0,0 +1,144 @@
+# Tarball extraction shared by the source_extract and package_recipe
+# modules. See the "Source extraction" section of the README.
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+CHUNK_SIZE = 1024 * 1024
+
+# Decompressors by tarball suffix, fastest first. Each command reads the
+# tarball named last and writes the tar stream to stdout. `{threads}` is the
+# thread count (0: one per CPU), `{cpus}` the same for decoders that take
+# no 0.
+DECOMPRESSORS = {
+    ".xz": [["xz", "-dc", "-T{threads}"]],
+    ".txz": [["xz", "-dc", "-T{threads}"]],
+    ".zst": [["zstd", "-dc", "-T{threads}"]],
+    ".gz": [["pigz", "-dc", "-p{cpus}"], ["gzip", "-dc"]],
+    ".tgz": [["pigz", "-dc", "-p{cpus}"], ["gzip", "-dc"]],
+    ".bz2": [["lbzip2", "-dc", "-n{cpus}"], ["pbzip2", "-dc", "-p{cpus}"], ["bzip2", "-dc"]],
+    ".lz": [["lzip", "-dc"]],
+}
+
+DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+def decompressor(src, threads=0):
+    """
+    Picks the decompress command for a tarball, preferring multi-threaded
+    decoders that are installed.
+
+    Returns:
+        list[str]: The command, or None for an uncompressed tar.
+    """
+    for suffix, candidates in DECOMPRESSORS.items():
+        if src.endswith(suffix):
+            for command in candidates:
+                if shutil.which(command[0]):
+                    values = dict(threads=threads, cpus=threads or os.cpu_count() or 1)
+                    return [arg.format(**values) for arg in command] + [src]
+            return [candidates[-1][0], "-dc", src]
+    return None
+
+
+def tarball_digest(src):
+    """
+    Returns the sha256 of a tarball. A tarball linked into the source store
+    (see source_prefetch) is named by it already, so is not read again.
+    """
+    if os.path.islink(src) and DIGEST.match(os.path.basename(os.readlink(src))):
+        return os.path.basename(os.readlink(src))
+    digest = hashlib.sha256()
+    with open(src, "rb") as infile:
+        for chunk in iter(lambda: infile.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def run_pipeline(src, targets, threads=0):
+    """
+    Decompresses `src` once and untars the stream into every directory in
+    `targets`, straight from the decoder: nothing is written in between.
+
+    Returns:
+        tuple[int, str]: Exit status (0 if every process succeeded) and
+            their stderr.
+    """
+    command = decompressor(src, threads)
+    # stderr goes to files, so a chatty process never blocks on a full pipe.
+    errors = [tempfile.TemporaryFile() for _ in range(len(targets) + 1)]
+    source = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors[0]) \
+        if command else None
+    tars = [subprocess.Popen(["tar", "-xf", "-", "-C", target], stdin=subprocess.PIPE,
+                             stderr=error) for target, error in zip(targets, errors[1:])]
+    try:
+        with (source.stdout if source else open(src, "rb")) as stream:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                for tar in tars:
+                    tar.stdin.write(chunk)
+    except BrokenPipeError:
+        pass  # a tar failed; its status and stderr say why
+    finally:
+        for tar in tars:
+            try:
+                tar.stdin.close()
+            except BrokenPipeError:
+                pass
+    rc = 0
+    for process in ([source] if source else []) + tars:
+        rc = rc or process.wait()
+    stderr = []
+    for error in errors:
+        error.seek(0)
+        stderr.append(error.read().decode(errors="replace"))
+        error.close()
+    return rc, "".join(stderr)
+
+
+def extract(src, dest, creates=None, cache=None, threads=0):
+    """
+    Extracts a tarball into `dest`.
+
+    With `cache`, the extracted tree is also kept in `<cache>/<sha256 of
+    the tarball>`, and a tarball whose tree is already there is copied from
+    it instead of being decompressed again.
+
+    Args:
+        src (str): The tarball.
+        dest (str): Directory to extract into.
+        creates (str, optional): Skip if this path exists already. An empty
+            directory does not count: it is the tmpfs source_tmpfs mounted
+            for the tree.
+        cache (str, optional): The extracted tree cache.
+        threads (int): Decompressor threads, 0 for one per CPU.
+
+    Returns:
+        dict: `changed`, `how` (skipped, cached, extracted), `rc`, `stderr`.
+    """
+    if creates and os.path.exists(creates) and not (os.path.isdir(creates) and not os.listdir(creates)):
+        return dict(changed=False, how="skipped", rc=0, stderr="")
+    if not cache:
+        rc, stderr = run_pipeline(src, [dest], threads)
+        return dict(changed=True, how="extracted", rc=rc, stderr=stderr)
+
+    tree = os.path.join(cache, tarball_digest(src))
+    if os.path.isdir(tree):
+        # --reflink=auto makes this a cheap clone where the filesystem can.
+        result = subprocess.run(["cp", "-a", "--reflink=auto", f"{tree}/.", dest],
+                                capture_output=True, text=True, errors="replace", check=False)
+        return dict(changed=True, how="cached", rc=result.returncode, stderr=result.stderr)
+
+    # Filled from the same decompressed stream as dest, under a temporary
+    # name: a failed or concurrent extraction never leaves a partial tree
+    # behind under the real one.
+    tmp = f"{tree}.{os.getpid()}.tmp"
+    os.makedirs(tmp)
+    rc, stderr = run_pipeline(src, [dest, tmp], threads)
+    if rc == 0 and not os.path.exists(tree):
+        os.rename(tmp, tree)
+    else:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return dict(changed=True, how="extracted", rc=rc, stderr=stderr)
@@ -1,18 +1,126 @@
 #!/usr/bin/env python3
 from app import Main
+from app.logstore import list_runs, search
+from app.snapshots import SNAPSHOT_STAGES, list_snapshots, print_snapshots, restore_snapshot
+from app.timeline import STAGES, list_timelines, print_report
 import argparse
+import re
+import sys
+
+
+def regex(value):
+    try:
+        return re.compile(value)
+    except re.error as error:
+        raise argparse.ArgumentTypeError(f"invalid regular expression {value!r}: {error}")
+
+
+def report(args):
+    timelines = list_timelines()
+    path = args.timeline or (timelines[-1] if timelines else None)
+    if path is None:
+        sys.stderr.write("no timeline recorded yet\n")
+        sys.exit(1)
+
+    baseline = args.baseline
+    if baseline is None and not args.no_diff:
+        earlier = [t for t in timelines if t != path and t < path]
+        baseline = earlier[-1] if earlier else None
+    print_report(path, baseline_path=baseline, top=args.top)
+
+
+def logs(args):
+    runs = list_runs()
+    run_id = args.run or (runs[-1] if runs else None)
+    if run_id is None:
+        sys.stderr.write("no build logs stored yet\n")
+        sys.exit(1)
+
+    found = False
+    current = None
+    for entry, number, line in search(run_id, args.package, args.grep, args.phase):
+        found = True
+        if args.grep:
+            print(f"{entry['phase']}:{entry['task']}:{number}: {line}")
+            continue
+        if entry is not current:
+            current = entry
+            print(f"\33[33m### [{entry['phase']}] {entry['task']} ({entry['status']})\033[00m")
+        print(line)
+    if not found:
+        sys.exit(1)
+
+
+def snapshots(args):
+    recorded = list_snapshots()
+    if not recorded:
+        sys.stderr.write("no stage snapshots taken yet\n")
+        sys.exit(1)
+    print_snapshots(recorded)
 
 
 def main():
     build_host = None
     parser = argparse.ArgumentParser()
 
-    parser.add_argument("-b", "--build-host", help="build host", required=True)
+    parser.add_argument("-b", "--build-host", help="build host")
+    stage_group = parser.add_mutually_exclusive_group()
+    stage_group.add_argument(
+        "--from-stage", choices=STAGES,
+        help="run this stage and every stage after it, even if up to date")
+    stage_group.add_argument(
+        "--only-stage", choices=STAGES, help="run only this stage (plus docker, prepare and prefetch)")
+    stage_group.add_argument(
+        "--restore-snapshot", choices=SNAPSHOT_STAGES, metavar="STAGE",
+        help="put back the disk images as they were after this stage, then run every stage after it")
+    subparsers = parser.add_subparsers(dest="command")
+
+    report_parser = subparsers.add_parser(
+        "report", help="summarize a recorded build timeline")
+    report_parser.add_argument(
+        "timeline", nargs="?", help="timeline file (default: the latest run)")
+    report_parser.add_argument(
+        "--baseline", help="timeline to diff against (default: the run before)")
+    report_parser.add_argument(
+        "--no-diff", action="store_true", help="do not diff against a previous run")
+    report_parser.add_argument(
+        "--top", type=int, default=15, help="number of slowest packages to list")
+
+    logs_parser = subparsers.add_parser(
+        "logs", help="show or search the stored output of a package")
+    logs_parser.add_argument(
+        "package", help="package recipe name (e.g. glibc) or stage (e.g. kernel)")
+    logs_parser.add_argument("--grep", metavar="PATTERN", type=regex, help="only print matching lines")
+    logs_parser.add_argument("--phase", help="only look at one phase (e.g. make)")
+    logs_parser.add_argument("--run", help="run id (default: the latest run)")
+
+    subparsers.add_parser("snapshots", help="list the disk image snapshots taken after each stage")
+
     args = parser.parse_args()
-    if args.build_host:
-        build_host = args.build_host
+    if args.command == "report":
+        report(args)
+        return
+    if args.command == "logs":
+        logs(args)
+        return
+    if args.command == "snapshots":
+        snapshots(args)
+        return
+
+    if not args.build_host:
+        parser.error("the following arguments are required: -b/--build-host")
+    build_host = args.build_host
+
+    from_stage = args.from_stage
+    if args.restore_snapshot:
+        snapshot = restore_snapshot(args.restore_snapshot)
+        if snapshot is None:
+            sys.stderr.write(f"no snapshot of the {args.restore_snapshot} stage (python run.py snapshots)\n")
+            sys.exit(1)
+        print(f"Restored the disk images as of {snapshot['taken']}, after the {snapshot['stage']} stage")
+        from_stage = STAGES[STAGES.index(args.restore_snapshot) + 1]
 
-    app = Main(host=build_host)
+    app = Main(host=build_host, from_stage=from_stage, only_stage=args.only_stage)
     app.run()
 
 